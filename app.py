@@ -41,7 +41,11 @@ def init_database(app):
             logging.error(f"Erro ao criar tabelas: {str(e)}")
             return
         
-        from app.models import SystemSetting
+        from app.models import SystemSetting, task_assignments, rebuild_task_assignments
+        
+        # Popular a tabela normalizada de responsáveis na primeira execução
+        if db.session.query(task_assignments).first() is None:
+            rebuild_task_assignments()
         
         # Criar configurações padrão do sistema
         default_settings = [
@@ -1,17 +1,34 @@
 # app/__init__.py
-from flask import Flask
+from flask import Flask, current_app, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_caching import Cache
+from jinja2 import FileSystemBytecodeCache
+import os
+from datetime import datetime, timezone
 
-db = SQLAlchemy()
+# Objetos continuam utilizáveis após o commit (sem novo SELECT ao acessá-los)
+db = SQLAlchemy(session_options={'expire_on_commit': False})
 migrate = Migrate()
 login_manager = LoginManager()
 mail = Mail()
 cache = Cache()
 
+# Backends do Flask-Caching que vivem na memória de cada processo
+LOCAL_CACHE_TYPES = {'simplecache', 'nullcache', 'simple', 'null'}
+
+def cache_is_shared() -> bool:
+    """Se o cache é visto por todos os processos (web e Celery) e não só pelo atual"""
+    cache_type = str(current_app.config.get('CACHE_TYPE', 'SimpleCache'))
+    return cache_type.rsplit('.', 1)[-1].lower() not in LOCAL_CACHE_TYPES
+
+def cache_inc(key: str, delta: int = 1):
+    """Incrementa (ou decrementa, com delta negativo) direto no backend: INCRBY atômico no Redis"""
+    # O proxy Cache do Flask-Caching não expõe inc/dec; só o backend (cache.cache) tem
+    return cache.cache.inc(key, delta)
+
 def create_app(config_class='config.Config'):
     app = Flask(__name__)
     app.config.from_object(config_class)
@@ -23,6 +40,17 @@ def create_app(config_class='config.Config'):
     mail.init_app(app)
     cache.init_app(app)
     
+    # Serialização JSON (jsonify/get_json) via orjson
+    from app.utils.json_provider import OrjsonProvider
+    app.json = OrjsonProvider(app)
+    
+    # Cache de bytecode dos templates (evita parse/compile em workers novos)
+    bytecode_cache_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if bytecode_cache_dir:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory=bytecode_cache_dir)
+    app.jinja_env.auto_reload = app.config.get('DEBUG', False)
+    
     # Configurar login manager
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Por favor, faça login para acessar esta página.'
@@ -45,6 +73,15 @@ def create_app(config_class='config.Config'):
             from datetime import datetime
             return datetime.now().year
     
+    # Data/hora da requisição, calculada uma única vez e compartilhada com os templates
+    @app.before_request
+    def set_request_now():
+        g.now_utc = datetime.now(timezone.utc)
+    
+    @app.context_processor
+    def inject_now_date():
+        return {'now_date': getattr(g, 'now_utc', None) or datetime.now(timezone.utc)}
+    
     # Importar e registrar blueprints
     from app.routes.auth import auth_bp
     from app.routes.main import main_bp
@@ -1,9 +1,11 @@
-from app import db
+from app import db, cache, cache_inc
 from flask_login import UserMixin
 from datetime import datetime, timezone
 import json
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy import event
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.dialects.postgresql import JSONB
 import enum
 
 
@@ -217,6 +219,14 @@ class Bucket(db.Model):
             'total_tasks': self.total_tasks
         }
 
+# Responsáveis por tarefa normalizados (espelho de Task.assignments_json para agregações)
+task_assignments = db.Table(
+    'task_assignments',
+    db.Column('task_id', db.String(255), db.ForeignKey('tasks.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('user_azure_id', db.String(255), primary_key=True),
+    db.Index('ix_task_assignments_user_task', 'user_azure_id', 'task_id')
+)
+
 class Task(db.Model):
     __tablename__ = 'tasks'
     
@@ -261,6 +271,20 @@ class Task(db.Model):
     time_estimate = db.Column(db.Integer)  # em horas
     time_spent = db.Column(db.Integer)  # em horas
     
+    __table_args__ = (
+        # Índice parcial: só as tarefas atrasadas (resumo diário e varredura de atrasos)
+        db.Index(
+            'ix_tasks_overdue', due_date,
+            postgresql_where=is_overdue == True,
+            sqlite_where=is_overdue == True
+        ),
+        # Métricas do planner: o SELECT agregado por planner_id sai todo do índice (index-only scan no PostgreSQL)
+        db.Index(
+            'ix_tasks_planner_status', planner_id, status,
+            postgresql_include=['is_overdue', 'is_blocked']
+        ),
+    )
+    
     @hybrid_property
     def checklist_completion(self):
         if self.checklists_total > 0:
@@ -299,16 +323,24 @@ class Task(db.Model):
             return []
     
     def set_labels(self, labels):
-        self.labels = json.dumps(labels)
+        self.labels = json.dumps(labels, sort_keys=True)
     
     def get_assignments(self):
+        # Memoizado na instância enquanto assignments_json for o mesmo objeto (set/refresh invalidam)
+        raw = self.assignments_json
+        cached = getattr(self, '_assignments_cache', None)
+        if cached is not None and cached[0] is raw:
+            return cached[1]
+        
         try:
-            return json.loads(self.assignments_json) if self.assignments_json else {}
+            assignments = json.loads(raw) if raw else {}
         except:
-            return {}
+            assignments = {}
+        self._assignments_cache = (raw, assignments)
+        return assignments
     
     def set_assignments(self, assignments):
-        self.assignments_json = json.dumps(assignments)
+        self.assignments_json = json.dumps(assignments, sort_keys=True)
     
     def to_dict(self):
         return {
@@ -486,13 +518,14 @@ class Report(db.Model):
     description = db.Column(db.Text)
     report_type = db.Column(db.String(50))
     report_format = db.Column(db.String(20), default='excel')  # 'excel', 'pdf', 'csv', 'html'
-    filters = db.Column(db.Text)  # JSON filters
+    filters = db.Column(db.JSON().with_variant(JSONB, 'postgresql'))  # JSON filters
     schedule = db.Column(db.Enum(ReportFrequency), default=ReportFrequency.CUSTOM)
     schedule_config = db.Column(db.Text)  # JSON com configurações do schedule
-    recipients = db.Column(db.Text)  # JSON array de emails
+    recipients = db.Column(db.JSON().with_variant(JSONB, 'postgresql'))  # Array de emails
     last_run = db.Column(db.DateTime)
     next_run = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True)
+    is_global = db.Column(db.Boolean, default=False)  # Relatório compartilhado
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), 
                           onupdate=lambda: datetime.now(timezone.utc))
@@ -501,17 +534,33 @@ class Report(db.Model):
     report_runs = db.relationship('ReportRun', backref='report', lazy=True, 
                                  cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Índice GIN para consultas por filtro (ignorado fora do PostgreSQL)
+        db.Index('ix_reports_filters', 'filters', postgresql_using='gin'),
+        # Lista de relatórios do usuário já ordenada (sem sort em memória)
+        db.Index('ix_reports_user_created', user_id, created_at.desc()),
+        # Índice parcial para relatórios globais ordenados por nome
+        db.Index('ix_reports_global_name', name,
+                 postgresql_where=(is_global == True),
+                 sqlite_where=(is_global == True)),
+    )
+    
     def get_filters(self):
-        try:
-            return json.loads(self.filters) if self.filters else {}
-        except:
-            return {}
+        # Coluna JSON: o driver já entrega dict; strings são legado de TEXT
+        if isinstance(self.filters, str):
+            try:
+                return json.loads(self.filters)
+            except:
+                return {}
+        return self.filters or {}
     
     def get_recipients(self):
-        try:
-            return json.loads(self.recipients) if self.recipients else []
-        except:
-            return []
+        if isinstance(self.recipients, str):
+            try:
+                return json.loads(self.recipients)
+            except:
+                return []
+        return self.recipients or []
     
     def get_schedule_config(self):
         try:
@@ -532,6 +581,11 @@ class ReportRun(db.Model):
     error_message = db.Column(db.Text)
     records_processed = db.Column(db.Integer)
     file_size = db.Column(db.Integer)
+    
+    __table_args__ = (
+        # Execuções de um relatório, mais recentes primeiro
+        db.Index('ix_report_runs_report_started', report_id, started_at.desc()),
+    )
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
@@ -560,6 +614,26 @@ class Notification(db.Model):
             return json.loads(self.action_data) if self.action_data else {}
         except:
             return {}
+    
+    __table_args__ = (
+        # Listagem paginada por cursor (created_at, id) das notificações do usuário
+        db.Index('ix_notif_user_readts', user_id, is_read, created_at.desc(), id),
+        # Notificações recentes do usuário (lidas e não lidas) já na ordem do índice
+        db.Index('ix_notif_user_created', user_id, created_at.desc()),
+        # Índice parcial para a varredura de arquivamento (só lidas ainda não arquivadas)
+        db.Index(
+            'ix_notif_archive_pending', created_at,
+            postgresql_where=db.and_(is_read == True, is_archived == False),
+            sqlite_where=db.and_(is_read == True, is_archived == False)
+        ),
+        # Idempotência: no máximo uma notificação por usuário/tarefa/tipo por dia (INSERT ... ON CONFLICT DO NOTHING)
+        db.Index(
+            'ux_notif_task_daily', user_id, entity_type, entity_id, notification_type, db.func.date(created_at),
+            unique=True,
+            postgresql_where=entity_type == 'task',
+            sqlite_where=entity_type == 'task'
+        ),
+    )
 
 class ActivityLog(db.Model):
     __tablename__ = 'activity_logs'
@@ -627,4 +701,100 @@ class SystemSetting(db.Model):
         elif self.value_type == 'boolean':
             return self.value.lower() == 'true'
         else:
-            return self.value
\ No newline at end of file
+            return self.value
+
+# Cache dos responsáveis exibidos nas listagens de tarefas
+ASSIGNEE_CACHE_KEY = 'assignees:v1:{}'
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_assignee_cache(mapper, connection, target):
+    """Invalida o cache do responsável quando o usuário muda"""
+    if target.azure_id:
+        cache.delete(ASSIGNEE_CACHE_KEY.format(target.azure_id))
+
+# Contadores de notificações por usuário (total e não lidas)
+NOTIFICATION_TOTAL_KEY = 'notif:total:{}'
+NOTIFICATION_UNREAD_KEY = 'notif:unread:{}'
+
+def bump_notification_counter(key, delta):
+    """Ajusta o contador em cache com INCRBY/DECRBY atômico"""
+    value = cache_inc(key, delta)
+    # Chave ausente: o INCRBY criou o contador só com o delta; descarta para recontar no banco
+    if value is None or value == delta or value < 0:
+        cache.delete(key)
+
+@event.listens_for(Notification, 'after_insert')
+def increment_notification_counters(mapper, connection, target):
+    """Incrementa os contadores ao criar notificação"""
+    bump_notification_counter(NOTIFICATION_TOTAL_KEY.format(target.user_id), 1)
+    if not target.is_read:
+        bump_notification_counter(NOTIFICATION_UNREAD_KEY.format(target.user_id), 1)
+
+@event.listens_for(Notification, 'after_delete')
+def decrement_notification_counters(mapper, connection, target):
+    """Decrementa os contadores ao excluir notificação"""
+    bump_notification_counter(NOTIFICATION_TOTAL_KEY.format(target.user_id), -1)
+    if not target.is_read:
+        bump_notification_counter(NOTIFICATION_UNREAD_KEY.format(target.user_id), -1)
+
+@event.listens_for(Notification, 'after_update')
+def update_unread_counter(mapper, connection, target):
+    """Atualiza o contador de não lidas quando is_read muda"""
+    history = get_history(target, 'is_read')
+    if history.has_changes():
+        delta = -1 if target.is_read else 1
+        bump_notification_counter(NOTIFICATION_UNREAD_KEY.format(target.user_id), delta)
+
+def _sync_task_assignments(connection, task_id, assignments_json):
+    """Regrava as linhas de task_assignments de uma tarefa"""
+    connection.execute(task_assignments.delete().where(task_assignments.c.task_id == task_id))
+    try:
+        user_ids = list(json.loads(assignments_json)) if assignments_json else []
+    except (TypeError, ValueError):
+        user_ids = []
+    if user_ids:
+        connection.execute(task_assignments.insert(), [
+            {'task_id': task_id, 'user_azure_id': user_id} for user_id in user_ids
+        ])
+
+@event.listens_for(Task, 'after_insert')
+def insert_task_assignments(mapper, connection, target):
+    """Popula task_assignments ao criar a tarefa"""
+    _sync_task_assignments(connection, target.id, target.assignments_json)
+
+@event.listens_for(Task, 'after_update')
+def update_task_assignments(mapper, connection, target):
+    """Atualiza task_assignments quando os responsáveis mudam"""
+    if get_history(target, 'assignments_json').has_changes():
+        _sync_task_assignments(connection, target.id, target.assignments_json)
+
+@event.listens_for(Task, 'after_delete')
+def delete_task_assignments(mapper, connection, target):
+    """Remove task_assignments da tarefa excluída"""
+    connection.execute(task_assignments.delete().where(task_assignments.c.task_id == target.id))
+
+def rebuild_task_assignments():
+    """Recria task_assignments a partir do JSON de todas as tarefas"""
+    connection = db.session.connection()
+    connection.execute(task_assignments.delete())
+    for task_id, assignments_json in db.session.query(Task.id, Task.assignments_json).yield_per(1000):
+        _sync_task_assignments(connection, task_id, assignments_json)
+    db.session.commit()
+
+# Versão dos resultados de analytics em cache; incrementada a cada escrita em tarefas/planners
+ANALYTICS_VERSION_KEY = 'analytics:version'
+
+@event.listens_for(db.session, 'after_flush')
+def bump_analytics_version(session, flush_context):
+    """Invalida o cache de analytics quando tarefas ou planners mudam"""
+    changed = session.new | session.dirty | session.deleted
+    if any(isinstance(obj, (Task, Planner)) for obj in changed):
+        cache_inc(ANALYTICS_VERSION_KEY)
+
+@event.listens_for(db.session, 'after_bulk_update')
+@event.listens_for(db.session, 'after_bulk_delete')
+def bump_analytics_version_bulk(context):
+    """Invalida o cache de analytics em UPDATE/DELETE em massa"""
+    if context.mapper.class_ in (Task, Planner):
+        cache_inc(ANALYTICS_VERSION_KEY)
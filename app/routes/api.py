@@ -10,6 +10,7 @@ from app.services.analytics_service import AnalyticsService
 from app.services.microsoft_api import MicrosoftPlannerAPI
 from app.utils.decorators import admin_required, rate_limit
 from app.services.planner_sync import PlannerSync
+from app.services.notification_service import get_notification_service
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -230,10 +231,8 @@ def update_task_status(task_id):
         
         # Enviar notificação se necessário
         try:
-            from app.services.notification_service import NotificationService
-            notification_service = NotificationService(current_app)
             if new_status == 'completed':
-                notification_service.send_task_completion_notification(task, current_user)
+                get_notification_service().send_task_completion_notification(task, current_user)
         except Exception as notif_error:
             current_app.logger.warning(f'Erro ao enviar notificação: {str(notif_error)}')
         
@@ -651,11 +650,8 @@ def get_notifications():
                 'entity_id': notification.entity_id
             })
         
-        # Contagem de não lidas
-        unread_count = Notification.query.filter_by(
-            user_id=current_user.id,
-            is_read=False
-        ).count()
+        # Contagem de não lidas (contador em cache, sem COUNT a cada chamada)
+        unread_count = get_notification_service().get_unread_count(current_user.id)
         
         return jsonify({
             'success': True,
@@ -712,18 +708,10 @@ def get_unread_notifications():
 def mark_notification_read(notification_id):
     """API para marcar notificação como lida"""
     try:
-        notification = Notification.query.filter_by(
-            id=notification_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not notification:
+        # UPDATE único que também mantém o contador de não lidas em cache
+        if not get_notification_service().mark_as_read(notification_id, current_user.id):
             return jsonify({'success': False, 'error': 'Notificação não encontrada'}), 404
         
-        notification.is_read = True
-        notification.read_at = datetime.utcnow()
-        db.session.commit()
-        
         return jsonify({'success': True, 'message': 'Notificação marcada como lida'})
         
     except Exception as e:
@@ -734,15 +722,9 @@ def mark_notification_read(notification_id):
 def mark_all_notifications_read():
     """API para marcar todas as notificações como lidas"""
     try:
-        Notification.query.filter_by(
-            user_id=current_user.id,
-            is_read=False
-        ).update({
-            'is_read': True,
-            'read_at': datetime.utcnow()
-        })
-        
-        db.session.commit()
+        # Pelo serviço: o UPDATE em massa não dispara os eventos que atualizam o contador
+        if not get_notification_service().mark_all_as_read(current_user.id):
+            return jsonify({'success': False, 'error': 'Erro ao marcar notificações como lidas'}), 500
         
         return jsonify({'success': True, 'message': 'Todas as notificações marcadas como lidas'})
         
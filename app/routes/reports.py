@@ -2,23 +2,34 @@ from flask import Blueprint, render_template, request, jsonify, send_file, flash
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 import json
+import hashlib
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from sqlalchemy import or_, update, select, func, lambda_stmt
+from pydantic import ValidationError
 
+from app import cache, cache_is_shared
 from app.models import db, Report, ReportRun, SavedFilter, Planner, Group, Task
+from app.schemas import ReportIn
 from app.services.report_service import ReportService
 from app.services.email_service import EmailService
 from app.services.analytics_service import AnalyticsService
 from app.utils.decorators import admin_required
+from app.utils.database import read_session
 
 reports_bp = Blueprint('reports', __name__, url_prefix='/reports')
 
+EXPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Janela em que uma execução em andamento bloqueia uma nova igual (segundos)
+RUN_LOCK_TIMEOUT = 600
+
 @reports_bp.route('/')
 @login_required
 def list_reports():
     """Lista de relatórios disponíveis"""
     try:
-        user_reports = Report.query.filter_by(user_id=current_user.id).order_by(Report.created_at.desc()).all()
-        system_reports = Report.query.filter_by(is_global=True).order_by(Report.name).all()
+        user_id = current_user.id
         
         # Relatórios pré-configurados
         predefined_reports = [
@@ -48,10 +59,20 @@ def list_reports():
             }
         ]
         
-        return render_template('reports/list.html',
-                             user_reports=user_reports,
-                             system_reports=system_reports,
-                             predefined_reports=predefined_reports)
+        # Leitura na réplica; o template é renderizado com a sessão ainda aberta
+        with read_session() as session:
+            # lambda_stmt: SQL compilado uma vez e reutilizado entre requisições
+            user_reports = session.execute(lambda_stmt(
+                lambda: select(Report).where(Report.user_id == user_id).order_by(Report.created_at.desc())
+            )).scalars().all()
+            system_reports = session.execute(lambda_stmt(
+                lambda: select(Report).where(Report.is_global == True).order_by(Report.name)
+            )).scalars().all()
+            
+            return render_template('reports/list.html',
+                                 user_reports=user_reports,
+                                 system_reports=system_reports,
+                                 predefined_reports=predefined_reports)
         
     except Exception as e:
         flash(f'Erro ao carregar relatórios: {str(e)}', 'error')
@@ -63,29 +84,22 @@ def create_report():
     """Cria um novo relatório"""
     try:
         if request.method == 'POST':
-            data = request.form
-            
-            # Criar configurações do relatório
-            report_config = {
-                'name': data.get('name'),
-                'description': data.get('description'),
-                'report_type': data.get('report_type'),
-                'filters': json.loads(data.get('filters', '{}')),
-                'schedule': data.get('schedule'),
-                'recipients': data.get('recipients', '').split(','),
-                'format': data.get('format', 'excel')
-            }
+            try:
+                payload = ReportIn.model_validate(request.form.to_dict())
+            except (ValidationError, ValueError) as e:
+                flash(f'Dados do relatório inválidos: {_format_validation_error(e)}', 'error')
+                return redirect(url_for('reports.create_report'))
             
             # Criar relatório no banco
             report = Report(
                 user_id=current_user.id,
-                name=report_config['name'],
-                description=report_config['description'],
-                report_type=report_config['report_type'],
-                report_format=report_config['format'],
-                filters=json.dumps(report_config['filters']),
-                schedule=report_config['schedule'],
-                recipients=json.dumps(report_config['recipients']),
+                name=payload.name,
+                description=payload.description,
+                report_type=payload.report_type,
+                report_format=payload.format,
+                filters=payload.filters,
+                schedule=payload.schedule,
+                recipients=payload.recipients,
                 is_active=True
             )
             
@@ -114,13 +128,29 @@ def create_report():
 def run_report(report_id):
     """Executa um relatório"""
     try:
-        report = Report.query.get_or_404(report_id)
+        # Permissão verificada no próprio WHERE (dono ou relatório global)
+        user_id = current_user.id
+        report = db.session.execute(lambda_stmt(
+            lambda: select(Report).where(
+                Report.id == report_id,
+                or_(Report.user_id == user_id, Report.is_global == True)
+            )
+        )).scalars().first()
         
-        # Verificar permissão
-        if report.user_id != current_user.id and not report.is_global:
+        if not report:
+            if _wants_json():
+                return jsonify({'success': False, 'error': 'Permissão negada'}), 403
             flash('Você não tem permissão para executar este relatório.', 'error')
             return redirect(url_for('reports.list_reports'))
         
+        # Sem cache compartilhado o lock abaixo não vale entre workers: a guarda fica no banco
+        shared = cache_is_shared()
+        if not shared:
+            existing_run = _find_running_run(report)
+            if existing_run:
+                db.session.rollback()
+                return _run_started_response(report_id, existing_run)
+        
         # Criar registro de execução
         report_run = ReportRun(
             report_id=report.id,
@@ -128,16 +158,29 @@ def run_report(report_id):
             started_at=datetime.utcnow()
         )
         db.session.add(report_run)
+        db.session.flush()
+        
+        # Evitar execuções duplicadas (duplo clique) com um lock por assinatura (SETNX no Redis)
+        lock_key = _run_lock_key(report, user_id)
+        if shared and not cache.add(lock_key, report_run.id, timeout=RUN_LOCK_TIMEOUT):
+            existing_id = cache.get(lock_key)
+            existing_run = db.session.get(ReportRun, existing_id) if existing_id else None
+            if existing_run and existing_run.status == 'running':
+                db.session.rollback()
+                return _run_started_response(report_id, existing_run)
+            cache.set(lock_key, report_run.id, timeout=RUN_LOCK_TIMEOUT)
+        
         db.session.commit()
         
         # Executar relatório em background (usando Celery)
         from app.tasks import run_report_task
         run_report_task.delay(report_id, report_run.id, current_user.id)
         
-        flash('Relatório está sendo gerado. Você será notificado quando estiver pronto.', 'info')
-        return redirect(url_for('reports.report_status', report_id=report_id, run_id=report_run.id))
+        return _run_started_response(report_id, report_run)
         
     except Exception as e:
+        if _wants_json():
+            return jsonify({'success': False, 'error': str(e)}), 500
         flash(f'Erro ao executar relatório: {str(e)}', 'error')
         return redirect(url_for('reports.list_reports'))
 
@@ -146,14 +189,15 @@ def run_report(report_id):
 def report_status(report_id, run_id):
     """Verifica status da execução do relatório"""
     try:
-        report_run = ReportRun.query.get_or_404(run_id)
-        report = Report.query.get_or_404(report_id)
+        # Primário: o status é consultado logo após run_report (réplica com atraso daria 404/estado antigo)
+        row = _get_authorized_run(report_id, run_id)
         
-        # Verificar permissão
-        if report.user_id != current_user.id and not report.is_global:
+        if not row:
             flash('Acesso não autorizado.', 'error')
             return redirect(url_for('reports.list_reports'))
         
+        report_run, report = row
+        
         return render_template('reports/status.html',
                              report=report,
                              report_run=report_run)
@@ -162,27 +206,82 @@ def report_status(report_id, run_id):
         flash(f'Erro ao verificar status: {str(e)}', 'error')
         return redirect(url_for('reports.list_reports'))
 
+@reports_bp.route('/api/runs')
+@login_required
+def report_runs_status():
+    """Status de várias execuções em uma única requisição (polling)"""
+    try:
+        ids = [
+            int(run_id) for run_id in request.args.get('ids', '').split(',')
+            if run_id.strip().isdigit()
+        ][:100]
+        
+        runs = []
+        if ids:
+            user_id = current_user.id
+            # Primário: polling de execuções recém-criadas (sem atraso de replicação)
+            runs = db.session.execute(lambda_stmt(
+                lambda: select(
+                    ReportRun.id,
+                    ReportRun.report_id,
+                    ReportRun.status,
+                    ReportRun.completed_at,
+                    ReportRun.error_message,
+                    ReportRun.records_processed
+                ).join(
+                    Report, Report.id == ReportRun.report_id
+                ).where(
+                    ReportRun.id.in_(ids),
+                    or_(Report.user_id == user_id, Report.is_global == True)
+                )
+            )).all()
+        
+        response = jsonify({
+            'success': True,
+            'runs': [{
+                'id': run.id,
+                'report_id': run.report_id,
+                'status': run.status,
+                'completed_at': run.completed_at.isoformat() if run.completed_at else None,
+                'error_message': run.error_message,
+                'records_processed': run.records_processed
+            } for run in runs]
+        })
+        
+        # ETag sobre o corpo: polls sem mudança recebem 304 sem corpo
+        response.add_etag()
+        return response.make_conditional(request)
+    
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @reports_bp.route('/<int:report_id>/run/<int:run_id>/download')
 @login_required
 def download_report(report_id, run_id):
     """Download do relatório gerado"""
     try:
-        report_run = ReportRun.query.get_or_404(run_id)
-        report = Report.query.get_or_404(report_id)
+        # Primário: o download segue o status lido do primário
+        row = _get_authorized_run(report_id, run_id)
         
-        # Verificar permissão
-        if report.user_id != current_user.id and not report.is_global:
+        if not row:
             flash('Acesso não autorizado.', 'error')
             return redirect(url_for('reports.list_reports'))
         
+        report_run, report = row
+        
         if report_run.status != 'completed' or not report_run.result_path:
             flash('Relatório não está disponível para download.', 'error')
             return redirect(url_for('reports.report_status', report_id=report_id, run_id=run_id))
         
+        # Resposta condicional: suporta Range (retomada de download) e 304 via ETag
         return send_file(
             report_run.result_path,
             as_attachment=True,
-            download_name=f"{report.name}_{report_run.started_at.strftime('%Y%m%d_%H%M%S')}.{report.report_format}"
+            download_name=f"{report.name}_{report_run.started_at.strftime('%Y%m%d_%H%M%S')}.{report.report_format}",
+            conditional=True,
+            etag=True,
+            last_modified=report_run.completed_at,
+            max_age=0
         )
         
     except Exception as e:
@@ -194,30 +293,48 @@ def download_report(report_id, run_id):
 def edit_report(report_id):
     """Edita um relatório existente"""
     try:
-        report = Report.query.get_or_404(report_id)
-        
-        # Verificar permissão
-        if report.user_id != current_user.id:
-            flash('Você não tem permissão para editar este relatório.', 'error')
-            return redirect(url_for('reports.list_reports'))
-        
         if request.method == 'POST':
-            data = request.form
+            try:
+                payload = ReportIn.model_validate(request.form.to_dict())
+            except (ValidationError, ValueError) as e:
+                flash(f'Dados do relatório inválidos: {_format_validation_error(e)}', 'error')
+                return redirect(url_for('reports.edit_report', report_id=report_id))
+            
+            # UPDATE com verificação de dono no WHERE (sem SELECT prévio)
+            stmt = update(Report).where(
+                Report.id == report_id,
+                Report.user_id == current_user.id
+            ).values(
+                name=payload.name,
+                description=payload.description,
+                report_type=payload.report_type,
+                filters=payload.filters,
+                schedule=payload.schedule,
+                recipients=payload.recipients,
+                report_format=payload.format,
+                updated_at=datetime.utcnow()
+            )
+            result = db.session.execute(stmt)
             
-            report.name = data.get('name')
-            report.description = data.get('description')
-            report.report_type = data.get('report_type')
-            report.filters = data.get('filters', '{}')
-            report.schedule = data.get('schedule')
-            report.recipients = json.dumps(data.get('recipients', '').split(','))
-            report.report_format = data.get('format', 'excel')
-            report.updated_at = datetime.utcnow()
+            if result.rowcount == 0:
+                db.session.rollback()
+                flash('Você não tem permissão para editar este relatório.', 'error')
+                return redirect(url_for('reports.list_reports'))
             
             db.session.commit()
             
             flash('Relatório atualizado com sucesso!', 'success')
             return redirect(url_for('reports.list_reports'))
         
+        user_id = current_user.id
+        report = db.session.execute(lambda_stmt(
+            lambda: select(Report).where(Report.id == report_id, Report.user_id == user_id)
+        )).scalars().first()
+        
+        if not report:
+            flash('Você não tem permissão para editar este relatório.', 'error')
+            return redirect(url_for('reports.list_reports'))
+        
         # GET - Mostrar formulário
         planners = Planner.query.all()
         groups = Group.query.filter_by(is_active=True).all()
@@ -238,18 +355,27 @@ def edit_report(report_id):
 def delete_report(report_id):
     """Exclui um relatório"""
     try:
-        report = Report.query.get_or_404(report_id)
+        owned_report = select(Report.id).where(
+            Report.id == report_id,
+            Report.user_id == current_user.id
+        )
+        
+        # Excluir execuções do relatório (apenas se o usuário for o dono)
+        ReportRun.query.filter(
+            ReportRun.report_id.in_(owned_report)
+        ).delete(synchronize_session=False)
+        
+        # Excluir relatório
+        deleted = Report.query.filter_by(
+            id=report_id,
+            user_id=current_user.id
+        ).delete(synchronize_session=False)
         
-        # Verificar permissão
-        if report.user_id != current_user.id:
+        if not deleted:
+            db.session.rollback()
             flash('Você não tem permissão para excluir este relatório.', 'error')
             return redirect(url_for('reports.list_reports'))
         
-        # Excluir execuções do relatório
-        ReportRun.query.filter_by(report_id=report_id).delete()
-        
-        # Excluir relatório
-        db.session.delete(report)
         db.session.commit()
         
         flash('Relatório excluído com sucesso!', 'success')
@@ -329,13 +455,17 @@ def export_report():
         
         # Exportar para o formato solicitado
         if format == 'excel':
-            output = report_service.export_to_excel(report_data, 'relatorio.xlsx')
+            # Até 8 MB fica em memória; acima disso vai para disco
+            output = SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE)
+            report_service.export_to_excel(report_data, 'relatorio.xlsx', output=output)
             
             return send_file(
                 output,
                 mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                 as_attachment=True,
-                download_name='relatorio.xlsx'
+                download_name='relatorio.xlsx',
+                conditional=True,
+                max_age=0
             )
         else:
             return jsonify({'success': False, 'error': 'Formato não suportado'}), 400
@@ -352,26 +482,104 @@ def schedule_report():
         report_id = data.get('report_id')
         schedule = data.get('schedule')
         
-        report = Report.query.get_or_404(report_id)
-        
-        # Verificar permissão
-        if report.user_id != current_user.id:
-            return jsonify({'success': False, 'error': 'Permissão negada'}), 403
-        
-        report.schedule = schedule
-        report.updated_at = datetime.utcnow()
+        values = {
+            'schedule': schedule,
+            'updated_at': datetime.utcnow()
+        }
         
         # Calcular próxima execução
+        next_run = None
         if schedule != 'none':
-            report.next_run = calculate_next_run(schedule)
+            next_run = calculate_next_run(schedule)
+            values['next_run'] = next_run
+        
+        # UPDATE com verificação de dono no WHERE
+        result = db.session.execute(
+            update(Report).where(
+                Report.id == report_id,
+                Report.user_id == current_user.id
+            ).values(**values)
+        )
+        
+        if result.rowcount == 0:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'Permissão negada'}), 403
         
         db.session.commit()
         
-        return jsonify({'success': True, 'next_run': report.next_run})
+        return jsonify({'success': True, 'next_run': next_run})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _format_validation_error(error):
+    """Resume erros de validação do formulário em uma linha"""
+    if isinstance(error, ValidationError):
+        return '; '.join(
+            f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}"
+            for err in error.errors()
+        )
+    return str(error)
+
+def _wants_json():
+    """Verifica se o cliente prefere resposta JSON (fetch/XHR)"""
+    if request.is_json:
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'text/html'])
+    return best == 'application/json' and \
+        request.accept_mimetypes[best] > request.accept_mimetypes['text/html']
+
+def _run_lock_key(report, user_id):
+    """Chave de lock derivada de (relatório, filtros, usuário)"""
+    filters_json = json.dumps(report.get_filters(), sort_keys=True)
+    sig = hashlib.blake2b(
+        f'{report.id}:{filters_json}:{user_id}'.encode(), digest_size=16
+    ).hexdigest()
+    return f'report:lock:{sig}'
+
+def _find_running_run(report):
+    """Execução recente ainda em andamento do relatório (guarda no banco, por relatório)"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # Serializa as submissões do mesmo relatório até o commit da execução criada
+        db.session.execute(select(func.pg_advisory_xact_lock(report.id)))
+    
+    cutoff = datetime.utcnow() - timedelta(seconds=RUN_LOCK_TIMEOUT)
+    return db.session.scalars(
+        select(ReportRun).where(
+            ReportRun.report_id == report.id,
+            ReportRun.status == 'running',
+            ReportRun.started_at >= cutoff
+        ).order_by(ReportRun.started_at.desc()).limit(1)
+    ).first()
+
+def _run_started_response(report_id, report_run):
+    """Resposta padrão para uma execução enfileirada"""
+    # Clientes JSON recebem 202 e fazem polling no endpoint em lote
+    if _wants_json():
+        return jsonify({
+            'success': True,
+            'run_id': report_run.id,
+            'status': report_run.status,
+            'poll_url': url_for('reports.report_runs_status', ids=report_run.id)
+        }), 202
+    
+    flash('Relatório está sendo gerado. Você será notificado quando estiver pronto.', 'info')
+    return redirect(url_for('reports.report_status', report_id=report_id, run_id=report_run.id))
+
+def _get_authorized_run(report_id, run_id, session=None):
+    """Busca execução e relatório em uma única query, já filtrando pela permissão"""
+    session = session or db.session
+    user_id = current_user.id
+    return session.execute(lambda_stmt(
+        lambda: select(ReportRun, Report).join(
+            Report, Report.id == ReportRun.report_id
+        ).where(
+            ReportRun.id == run_id,
+            Report.id == report_id,
+            or_(Report.user_id == user_id, Report.is_global == True)
+        )
+    )).first()
+
 def calculate_next_run(schedule):
     """Calcula a próxima execução baseada no schedule"""
     now = datetime.utcnow()
@@ -1,14 +1,28 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, make_response, \
+    current_app
 from flask_login import login_required, current_user
 from datetime import datetime
+import os
 import json
+import hashlib
+from celery.result import AsyncResult
+from sqlalchemy import tuple_
 
-from app.models import db, User, SystemSetting, Theme
-from app.services.email_service import EmailService
+from app import cache
+from app.models import (
+    db, User, SystemSetting, Theme, Notification,
+    NOTIFICATION_TOTAL_KEY, NOTIFICATION_UNREAD_KEY
+)
+from app.services.notification_service import get_notification_service
+from app.tasks.system_tasks import send_test_email, create_database_backup
+from app.utils.backup import BackupManager
 from app.utils.decorators import admin_required
 
 settings_bp = Blueprint('settings', __name__, url_prefix='/settings')
 
+SETTING_PREFIX = 'setting_'
+SETTING_PREFIX_LEN = len(SETTING_PREFIX)
+
 @settings_bp.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
@@ -86,19 +100,28 @@ def preferences():
 def notifications():
     """Gerenciamento de notificações"""
     try:
-        from app.models import Notification
-        from app.services.notification_service import NotificationService
-        
-        notification_service = NotificationService()
+        notification_service = get_notification_service()
         
-        # Paginação
-        page = request.args.get('page', 1, type=int)
+        # Paginação por cursor: 'before' = "<created_at ISO>_<id>" do último item da página anterior
         per_page = request.args.get('per_page', 20, type=int)
+        before = request.args.get('before')
         
         # Filtros
         show_read = request.args.get('show_read', 'false') == 'true'
         notification_type = request.args.get('type')
         
+        # Versão real da página (nova notificação, leitura ou exclusão muda o ETag), lida do banco
+        version = notification_service.get_notifications_version(current_user.id)
+        
+        etag = _make_etag(current_user.id, *version,
+                          show_read, notification_type, before, per_page)
+        if request.if_none_match.contains(etag):
+            return '', 304
+        
+        # Estatísticas
+        unread_count = notification_service.get_unread_count(current_user.id)
+        total_count = notification_service.get_total_count(current_user.id)
+        
         query = Notification.query.filter_by(user_id=current_user.id)
         
         if not show_read:
@@ -107,18 +130,29 @@ def notifications():
         if notification_type:
             query = query.filter_by(notification_type=notification_type)
         
-        notifications = query.order_by(Notification.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
-        
-        # Estatísticas
-        unread_count = notification_service.get_unread_count(current_user.id)
-        total_count = Notification.query.filter_by(user_id=current_user.id).count()
-        
-        return render_template('settings/notifications.html',
-                             notifications=notifications,
-                             unread_count=unread_count,
-                             total_count=total_count)
+        if before:
+            before_created, before_id = before.rsplit('_', 1)
+            query = query.filter(
+                tuple_(Notification.created_at, Notification.id) <
+                tuple_(datetime.fromisoformat(before_created), int(before_id))
+            )
+        
+        items = query.order_by(
+            Notification.created_at.desc(), Notification.id.desc()
+        ).limit(per_page + 1).all()
+        
+        has_next = len(items) > per_page
+        items = items[:per_page]
+        next_before = f'{items[-1].created_at.isoformat()}_{items[-1].id}' if has_next else None
+        
+        response = make_response(render_template('settings/notifications.html',
+                                                  notifications=items,
+                                                  has_next=has_next,
+                                                  next_before=next_before,
+                                                  unread_count=unread_count,
+                                                  total_count=total_count))
+        response.set_etag(etag)
+        return response
         
     except Exception as e:
         flash(f'Erro ao carregar notificações: {str(e)}', 'error')
@@ -129,12 +163,10 @@ def notifications():
 def mark_notification_read():
     """Marca notificação como lida"""
     try:
-        from app.services.notification_service import NotificationService
-        
         data = request.get_json()
         notification_id = data.get('notification_id')
         
-        notification_service = NotificationService()
+        notification_service = get_notification_service()
         
         if notification_id == 'all':
             success = notification_service.mark_all_as_read(current_user.id)
@@ -154,11 +186,16 @@ def mark_notification_read():
 def clear_all_notifications():
     """Limpa todas as notificações"""
     try:
-        from app.models import Notification
-        
-        Notification.query.filter_by(user_id=current_user.id).delete()
+        # Sem sincronizar a sessão: as linhas excluídas não são reutilizadas
+        Notification.query.filter_by(user_id=current_user.id).delete(synchronize_session=False)
         db.session.commit()
         
+        # DELETE em massa não dispara eventos do ORM
+        cache.delete_many(
+            NOTIFICATION_TOTAL_KEY.format(current_user.id),
+            NOTIFICATION_UNREAD_KEY.format(current_user.id)
+        )
+        
         return jsonify({'success': True})
         
     except Exception as e:
@@ -176,6 +213,10 @@ def get_sessions():
     """Obtém sessões ativas do usuário"""
     try:
         # Implementar rastreamento de sessões
+        etag = _make_etag(current_user.id, request.remote_addr, request.user_agent.string)
+        if request.if_none_match.contains(etag):
+            return '', 304
+        
         sessions = [
             {
                 'id': 'current',
@@ -186,7 +227,9 @@ def get_sessions():
             }
         ]
         
-        return jsonify({'success': True, 'sessions': sessions})
+        response = jsonify({'success': True, 'sessions': sessions})
+        response.set_etag(etag)
+        return response
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -218,24 +261,37 @@ def test_email():
         if not current_user.email:
             return jsonify({'success': False, 'error': 'Email não configurado'}), 400
         
-        email_service = EmailService()
-        
-        # Enviar email de teste
-        success = email_service.send_email(
-            to_emails=[current_user.email],
-            subject='Teste de Email - Planner Dashboard',
-            body_html='<h2>Teste de Email</h2><p>Este é um email de teste enviado pelo Planner Dashboard.</p>',
-            body_text='Teste de Email - Este é um email de teste enviado pelo Planner Dashboard.'
-        )
+        # Enviar email de teste em background
+        job = send_test_email.delay(current_user.email)
         
-        if success:
-            return jsonify({'success': True, 'message': 'Email de teste enviado com sucesso!'})
-        else:
-            return jsonify({'success': False, 'error': 'Falha ao enviar email'}), 500
+        return jsonify({
+            'success': True,
+            'message': 'Email de teste sendo enviado.',
+            'job_id': job.id,
+            'poll_url': url_for('settings.job_status', job_id=job.id)
+        }), 202
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@settings_bp.route('/api/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Consulta o estado de uma tarefa em background"""
+    try:
+        result = AsyncResult(job_id)
+        response = {'success': True, 'job_id': job_id, 'state': result.state}
+        
+        if result.successful():
+            response['result'] = result.result
+        elif result.failed():
+            response['error'] = str(result.result)
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @settings_bp.route('/system', methods=['GET', 'POST'])
 @admin_required
 def system_settings():
@@ -243,16 +299,22 @@ def system_settings():
     try:
         if request.method == 'POST':
             # Atualizar configurações do sistema
-            settings_data = request.form
+            updates = {
+                key[SETTING_PREFIX_LEN:]: value
+                for key, value in request.form.items()
+                if key[:SETTING_PREFIX_LEN] == SETTING_PREFIX
+            }
             
-            for key, value in settings_data.items():
-                if key.startswith('setting_'):
-                    setting_key = key.replace('setting_', '')
-                    setting = SystemSetting.query.filter_by(key=setting_key).first()
-                    
-                    if setting:
-                        setting.value = value
-                        setting.updated_at = datetime.utcnow()
+            if updates:
+                # Um SELECT para as chaves existentes e um UPDATE em lote
+                now = datetime.utcnow()
+                rows = db.session.query(SystemSetting.id, SystemSetting.key).filter(
+                    SystemSetting.key.in_(updates)
+                ).all()
+                db.session.bulk_update_mappings(SystemSetting, [
+                    {'id': row.id, 'value': updates[row.key], 'updated_at': now}
+                    for row in rows
+                ])
             
             db.session.commit()
             flash('Configurações do sistema atualizadas com sucesso!', 'success')
@@ -275,27 +337,35 @@ def backup():
     """Backup do sistema"""
     try:
         # Listar backups disponíveis
-        import os
-        from app.config import BACKUP_FOLDER
+        backup_folder = current_app.config.get('BACKUP_FOLDER', 'backups')
+        
+        # O mtime da pasta muda quando um backup é criado ou removido
+        folder_mtime = os.stat(backup_folder).st_mtime_ns if os.path.isdir(backup_folder) else None
+        etag = _make_etag(current_user.id, backup_folder, folder_mtime)
+        if request.if_none_match.contains(etag):
+            return '', 304
         
+        # scandir reaproveita os dados da listagem, evitando um stat por arquivo
         backups = []
-        if os.path.exists(BACKUP_FOLDER):
-            for file in os.listdir(BACKUP_FOLDER):
-                if file.endswith('.sql') or file.endswith('.backup'):
-                    filepath = os.path.join(BACKUP_FOLDER, file)
-                    stats = os.stat(filepath)
-                    
-                    backups.append({
-                        'filename': file,
-                        'size': stats.st_size,
-                        'created': datetime.fromtimestamp(stats.st_ctime),
-                        'modified': datetime.fromtimestamp(stats.st_mtime)
-                    })
-        
-        backups.sort(key=lambda x: x['created'], reverse=True)
-        
-        return render_template('settings/backup.html',
-                             backups=backups)
+        if os.path.isdir(backup_folder):
+            with os.scandir(backup_folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith(('.sql', '.backup')):
+                        stats = entry.stat()
+                        backups.append({
+                            'filename': entry.name,
+                            'size': stats.st_size,
+                            'created': datetime.fromtimestamp(stats.st_ctime),
+                            'modified': datetime.fromtimestamp(stats.st_mtime),
+                            'ctime': stats.st_ctime
+                        })
+        
+        backups.sort(key=lambda x: x['ctime'], reverse=True)
+        
+        response = make_response(render_template('settings/backup.html',
+                                                  backups=backups))
+        response.set_etag(etag)
+        return response
         
     except Exception as e:
         flash(f'Erro ao carregar backups: {str(e)}', 'error')
@@ -306,18 +376,15 @@ def backup():
 def create_backup():
     """Cria backup do banco de dados"""
     try:
-        from app.utils.backup import create_database_backup
-        
-        backup_file = create_database_backup()
-        
-        if backup_file:
-            return jsonify({
-                'success': True,
-                'message': 'Backup criado com sucesso!',
-                'filename': os.path.basename(backup_file)
-            })
-        else:
-            return jsonify({'success': False, 'error': 'Falha ao criar backup'}), 500
+        # pg_dump pode demorar; executar em background
+        job = create_database_backup.delay()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Backup sendo criado.',
+            'job_id': job.id,
+            'poll_url': url_for('settings.job_status', job_id=job.id)
+        }), 202
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -327,9 +394,7 @@ def create_backup():
 def restore_backup(filename):
     """Restaura backup do banco de dados"""
     try:
-        from app.utils.backup import restore_database_backup
-        
-        success = restore_database_backup(filename)
+        success = BackupManager(current_app).restore_database_backup(filename)
         
         if success:
             return jsonify({'success': True, 'message': 'Backup restaurado com sucesso!'})
@@ -344,10 +409,8 @@ def restore_backup(filename):
 def delete_backup(filename):
     """Exclui backup"""
     try:
-        import os
-        from app.config import BACKUP_FOLDER
-        
-        filepath = os.path.join(BACKUP_FOLDER, filename)
+        backup_folder = current_app.config.get('BACKUP_FOLDER', 'backups')
+        filepath = os.path.join(backup_folder, filename)
         
         if os.path.exists(filepath):
             os.remove(filepath)
@@ -356,4 +419,8 @@ def delete_backup(filename):
             return jsonify({'success': False, 'error': 'Arquivo não encontrado'}), 404
             
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _make_etag(*parts):
+    """Gera um ETag a partir das partes que definem a versão da resposta"""
+    return hashlib.md5(repr(parts).encode()).hexdigest()
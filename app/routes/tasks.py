@@ -1,16 +1,24 @@
 # app/routes/tasks.py - VERSÃO CORRIGIDA
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, \
+    Response, send_file, stream_with_context
 from flask_login import login_required, current_user
 from datetime import datetime, timezone
-from app.models import db, Task, Planner, Group, SavedFilter, TaskComment, TaskChange, User
+from app import cache
+from app.models import db, Task, Planner, Group, SavedFilter, TaskComment, TaskChange, User, ASSIGNEE_CACHE_KEY
 from app.services.report_service import ReportService
 from app.utils.task_filters import TaskFilter
 from app.services.email_service import EmailService
 from app.services.analytics_service import AnalyticsService
+from sqlalchemy.orm import load_only, contains_eager
 import json
 
 tasks_bp = Blueprint('tasks', __name__, url_prefix='/tasks')
 
+ASSIGNEE_CACHE_TIMEOUT = 300
+
+# Campos aceitos na atualização em massa
+BULK_UPDATE_FIELDS = ('status', 'priority', 'percent_complete')
+
 @tasks_bp.route('/')
 @login_required
 def list_tasks():
@@ -24,8 +32,15 @@ def list_tasks():
         query_params.pop('page', None)
         query_params.pop('per_page', None)
         
-        # Aplicar filtros
-        query = Task.query.join(Planner, Planner.id == Task.planner_id)
+        # Aplicar filtros (carregando apenas as colunas exibidas na listagem)
+        query = Task.query.join(Planner, Planner.id == Task.planner_id).options(
+            load_only(
+                Task.id, Task.planner_id, Task.title, Task.description, Task.status,
+                Task.priority, Task.percent_complete, Task.due_date, Task.is_overdue,
+                Task.labels, Task.assignments_json
+            ),
+            contains_eager(Task.planner)
+        )
         query = TaskFilter.apply_filters(query, query_params)
         
         # Paginação
@@ -36,18 +51,19 @@ def list_tasks():
         
         # Enriquecer tarefas com informações dos responsáveis
         # IMPORTANTE: Adicionar como atributo temporário, não converter para dict
-        for task in tasks.items:
+        all_assignments = [(task, task.get_assignments()) for task in tasks.items]
+        
+        # Buscar todos os responsáveis da página (cache + uma única query)
+        azure_ids = {user_id for _, assignments in all_assignments for user_id in assignments}
+        users_by_azure = _get_assignees_info(azure_ids)
+        
+        for task, assignments in all_assignments:
             # Obter nomes reais dos responsáveis
-            assignments = task.get_assignments()
             assignees = []
             for user_id, assignment in assignments.items():
-                user = User.query.filter_by(azure_id=user_id).first()
-                if user:
-                    assignees.append({
-                        'id': user_id,
-                        'name': user.display_name,
-                        'email': user.email
-                    })
+                user_info = users_by_azure.get(user_id)
+                if user_info:
+                    assignees.append({'id': user_id, **user_info})
                 else:
                     # Fallback para informações do JSON
                     assignees.append({
@@ -66,16 +82,12 @@ def list_tasks():
         # Filtros salvos
         saved_filters = SavedFilter.query.filter_by(user_id=current_user.id).all()
         
-        # CORREÇÃO: Usar datetime com timezone aware
-        now_date = datetime.now(timezone.utc)
-        
         return render_template('tasks/list.html',
                              tasks=tasks,
                              planners=planners,
                              groups=groups,
                              saved_filters=saved_filters,
                              filter_params=query_params,
-                             now_date=now_date,
                              request_args=request.args)
         
     except Exception as e:
@@ -83,6 +95,34 @@ def list_tasks():
         flash(f'Erro ao carregar tarefas: {str(e)}', 'error')
         return redirect(url_for('main.dashboard'))
 
+def _get_assignees_info(azure_ids):
+    """Retorna {azure_id: {name, email}} usando o cache e buscando só o que faltar"""
+    if not azure_ids:
+        return {}
+    
+    azure_ids = sorted(azure_ids)
+    keys = [ASSIGNEE_CACHE_KEY.format(azure_id) for azure_id in azure_ids]
+    cached = cache.get_many(*keys)
+    
+    users_info = {
+        azure_id: info for azure_id, info in zip(azure_ids, cached) if info
+    }
+    missing = [azure_id for azure_id in azure_ids if azure_id not in users_info]
+    
+    if missing:
+        fetched = {
+            user.azure_id: {'name': user.display_name, 'email': user.email}
+            for user in User.query.filter(User.azure_id.in_(missing)).all()
+        }
+        if fetched:
+            cache.set_many(
+                {ASSIGNEE_CACHE_KEY.format(azure_id): info for azure_id, info in fetched.items()},
+                timeout=ASSIGNEE_CACHE_TIMEOUT
+            )
+        users_info.update(fetched)
+    
+    return users_info
+
 @tasks_bp.route('/<task_id>')
 @login_required
 def task_detail(task_id):
@@ -161,15 +201,54 @@ def export_tasks():
         format = data.get('format', 'excel')
         
         report_service = ReportService(current_user)
-        report_data = report_service.generate_task_report(filters)
+        rows = report_service.iter_task_rows(filters)
         
-        # Implementar exportação conforme o formato
-        # Por enquanto, retornar JSON de exemplo
-        return jsonify({
-            'success': True,
-            'message': 'Exportação em desenvolvimento',
-            'data_count': len(report_data.get('dataframe', [])) if 'dataframe' in report_data else 0
-        })
+        if format == 'csv':
+            import csv
+            from io import StringIO
+            
+            def generate():
+                # Cada linha é escrita e enviada assim que lida do banco
+                buffer = StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(ReportService.TASK_EXPORT_HEADER)
+                for row in rows:
+                    writer.writerow(row)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+                yield buffer.getvalue()
+            
+            return Response(
+                stream_with_context(generate()),
+                mimetype='text/csv',
+                headers={'Content-Disposition': 'attachment; filename=tarefas.csv'}
+            )
+        
+        elif format == 'excel':
+            from openpyxl import Workbook
+            from tempfile import SpooledTemporaryFile
+            
+            # Modo write-only mantém apenas a linha corrente em memória
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet('Tarefas')
+            sheet.append(ReportService.TASK_EXPORT_HEADER)
+            for row in rows:
+                sheet.append(row)
+            
+            output = SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+            workbook.save(output)
+            output.seek(0)
+            
+            return send_file(
+                output,
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                as_attachment=True,
+                download_name='tarefas.xlsx',
+                max_age=0
+            )
+        
+        return jsonify({'success': False, 'error': 'Formato não suportado'}), 400
         
     except Exception as e:
         current_app.logger.error(f'Erro ao exportar tarefas: {str(e)}', exc_info=True)
@@ -189,35 +268,48 @@ def bulk_update():
         if not task_ids:
             return jsonify({'success': False, 'error': 'Nenhuma tarefa selecionada'}), 400
         
-        # Atualizar cada tarefa
-        for task_id in task_ids:
-            task = Task.query.get(task_id)
-            if task:
-                # Registrar mudança
-                change = TaskChange(
-                    task_id=task_id,
-                    field_changed='bulk_update',
-                    old_value=json.dumps(task.to_dict()),
-                    new_value=json.dumps(updates),
-                    changed_by=current_user.azure_id,
-                    changed_by_name=current_user.display_name,
-                    change_type='bulk_update'
-                )
-                db.session.add(change)
-                
-                # Aplicar atualizações
-                if 'status' in updates:
-                    task.status = TaskStatus(updates['status'])  # Converter string para enum
-                if 'priority' in updates:
-                    task.priority = TaskPriority(int(updates['priority']))  # Converter para enum
-                if 'percent_complete' in updates:
-                    task.percent_complete = updates['percent_complete']
-                
-                task.last_modified = datetime.now(timezone.utc)
+        # Converter os valores uma única vez
+        update_values = {Task.last_modified: datetime.now(timezone.utc)}
+        if 'status' in updates:
+            update_values[Task.status] = TaskStatus(updates['status'])  # Converter string para enum
+        if 'priority' in updates:
+            update_values[Task.priority] = TaskPriority(int(updates['priority']))  # Converter para enum
+        if 'percent_complete' in updates:
+            update_values[Task.percent_complete] = updates['percent_complete']
+        
+        # Auditoria guarda apenas o diff dos campos alterados
+        changed_fields = [field for field in BULK_UPDATE_FIELDS if field in updates]
         
+        # Valores anteriores em um único SELECT, apenas das colunas alteradas
+        old_rows = db.session.query(
+            Task.id, *[getattr(Task, field) for field in changed_fields]
+        ).filter(Task.id.in_(task_ids)).all()
+        
+        new_value = json.dumps({field: updates[field] for field in changed_fields}, default=str)
+        changes = [
+            TaskChange(
+                task_id=row.id,
+                field_changed=','.join(changed_fields) or 'bulk_update',
+                old_value=json.dumps({
+                    field: getattr(getattr(row, field), 'value', getattr(row, field))
+                    for field in changed_fields
+                }, default=str),
+                new_value=new_value,
+                changed_by=current_user.azure_id,
+                changed_by_name=current_user.display_name,
+                change_type='bulk_update'
+            )
+            for row in old_rows
+        ]
+        
+        # Um único UPDATE ... WHERE id IN (...)
+        updated = Task.query.filter(Task.id.in_(task_ids)).update(
+            update_values, synchronize_session=False
+        )
+        db.session.bulk_save_objects(changes)
         db.session.commit()
         
-        return jsonify({'success': True, 'updated': len(task_ids)})
+        return jsonify({'success': True, 'updated': updated})
         
     except Exception as e:
         db.session.rollback()
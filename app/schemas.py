@@ -0,0 +1,36 @@
+# app/schemas.py
+import json
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel, Field, field_validator
+
+class ReportIn(BaseModel):
+    """Dados do formulário de criação/edição de relatório"""
+    
+    name: str = Field(min_length=1, max_length=255)
+    description: str = ''
+    report_type: str = Field(min_length=1, max_length=50)
+    filters: Dict = Field(default_factory=dict)
+    schedule: Optional[str] = None
+    recipients: List[str] = Field(default_factory=list)
+    format: Literal['excel', 'csv', 'pdf'] = 'excel'
+    
+    @field_validator('filters', mode='before')
+    @classmethod
+    def parse_filters(cls, value):
+        # Formulário envia os filtros como string JSON
+        if isinstance(value, str):
+            return json.loads(value) if value.strip() else {}
+        return value
+    
+    @field_validator('schedule', mode='before')
+    @classmethod
+    def empty_schedule(cls, value):
+        return value or None
+    
+    @field_validator('recipients', mode='before')
+    @classmethod
+    def split_recipients(cls, value):
+        # Formulário envia os emails separados por vírgula
+        if isinstance(value, str):
+            return [email.strip() for email in value.split(',') if email.strip()]
+        return value
@@ -1,14 +1,55 @@
 import plotly.graph_objs as go
 import plotly.express as px
+import plotly.io as pio
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from sqlalchemy import func, desc, extract
-import json
+from sqlalchemy import func, case, and_, select, cast, literal, text, Date
+from functools import wraps
+from itertools import accumulate
+
+from app import cache, cache_is_shared
+from app.models import ANALYTICS_VERSION_KEY
+
+# Serialização das figuras via orjson (encoder em C, ciente de numpy)
+pio.json.config.default_engine = 'orjson'
+
+ANALYTICS_CACHE_TIMEOUT = 120
+
+def cached_analytics(timeout=ANALYTICS_CACHE_TIMEOUT):
+    """Memoiza o resultado (já serializado) no cache, por método e argumentos"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(self, *args, **kwargs):
+            # A versão só é incrementada no processo que gravou (web ou sync no Celery): sem cache
+            # compartilhado (Redis) as entradas dos outros workers nunca seriam invalidadas
+            if not cache_is_shared():
+                return f(self, *args, **kwargs)
+            
+            version = cache.get(ANALYTICS_VERSION_KEY) or 0
+            key = f"analytics:{version}:{f.__name__}:{args!r}:{sorted(kwargs.items())!r}"
+            
+            result = cache.get(key)
+            if result is None:
+                result = f(self, *args, **kwargs)
+                if result is not None:
+                    cache.set(key, result, timeout=timeout)
+            return result
+        return wrapper
+    return decorator
+
+def burndown_remaining(created, completed, days):
+    """Tarefas em aberto ao fim de cada dia: criadas até o dia menos concluídas até o dia"""
+    # Busca binária nos arrays ordenados: O((N + D) log N), sem laço Python por tarefa/dia
+    opened = np.searchsorted(np.sort(created), days, side='right')
+    closed = np.searchsorted(np.sort(completed), days, side='right')
+    return opened - closed
 
 class AnalyticsService:
     def __init__(self, db_session):
         self.db = db_session
     
+    @cached_analytics()
     def get_task_distribution_chart(self, user_id=None, group_id=None):
         """Gráfico de distribuição de tarefas"""
         from app.models import Task, TaskStatus, Planner
@@ -54,8 +95,9 @@ class AnalyticsService:
             plot_bgcolor='rgba(0,0,0,0)'
         )
         
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        return pio.to_json(fig, validate=False)
     
+    @cached_analytics()
     def get_completion_trend_chart(self, days=30):
         """Gráfico de tendência de conclusão"""
         from app.models import Task, TaskStatus
@@ -63,29 +105,35 @@ class AnalyticsService:
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        # Consulta para tarefas concluídas por dia
-        completed_tasks = self.db.session.query(
-            func.date(Task.completed_date).label('date'),
+        # Contagem de tarefas concluídas por dia
+        completed_tasks = select(
+            func.date(Task.completed_date).label('day'),
             func.count(Task.id).label('count')
-        ).filter(
+        ).where(
             Task.completed_date.between(start_date, end_date),
             Task.status == TaskStatus.COMPLETED  # CORREÇÃO: usar enum
-        ).group_by(func.date(Task.completed_date)).all()
-        
-        # Criar DataFrame com todos os dias
-        date_range = pd.date_range(start=start_date.date(), end=end_date.date())
-        df = pd.DataFrame({'date': date_range})
-        
-        # Adicionar contagens
-        completed_dict = {date: count for date, count in completed_tasks}
-        df['completed'] = df['date'].apply(lambda x: completed_dict.get(x, 0))
-        df['cumulative'] = df['completed'].cumsum()
+        ).group_by(func.date(Task.completed_date)).subquery()
+        
+        # Série de dias gerada no próprio banco, com zero nos dias sem conclusões
+        days_series = self._day_series(start_date.date(), end_date.date())
+        rows = self.db.session.execute(
+            select(
+                days_series.c.day,
+                func.coalesce(completed_tasks.c.count, 0)
+            ).outerjoin(
+                completed_tasks, completed_tasks.c.day == days_series.c.day
+            ).order_by(days_series.c.day)
+        ).all()
+        
+        dates = [day for day, _ in rows]
+        completed = [count for _, count in rows]
+        cumulative = list(accumulate(completed))
         
         fig = go.Figure()
         
         fig.add_trace(go.Scatter(
-            x=df['date'],
-            y=df['completed'],
+            x=dates,
+            y=completed,
             mode='lines+markers',
             name='Concluídas por dia',
             line=dict(color='#28a745', width=2),
@@ -93,8 +141,8 @@ class AnalyticsService:
         ))
         
         fig.add_trace(go.Scatter(
-            x=df['date'],
-            y=df['cumulative'],
+            x=dates,
+            y=cumulative,
             mode='lines',
             name='Total acumulado',
             line=dict(color='#3498db', width=2, dash='dash'),
@@ -114,32 +162,49 @@ class AnalyticsService:
             hovermode='x unified'
         )
         
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        return pio.to_json(fig, validate=False)
     
+    def _day_series(self, start, end):
+        """Subquery com um dia por linha entre start e end (inclusive)"""
+        if self.db.session.get_bind().dialect.name == 'postgresql':
+            return select(
+                cast(func.generate_series(start, end, text("interval '1 day'")), Date).label('day')
+            ).subquery()
+        
+        # SQLite e demais: CTE recursiva com datas ISO
+        days = select(literal(start.isoformat()).label('day')).cte('days', recursive=True)
+        return days.union_all(
+            select(func.date(days.c.day, '+1 day')).where(days.c.day < end.isoformat())
+        )
+    
+    @cached_analytics()
     def get_workload_chart(self):
         """Gráfico de workload por usuário"""
-        from app.models import Task, User
-        
-        # Consulta para tarefas por usuário
-        workload_data = []
-        users = User.query.filter_by(is_active=True).all()
+        from app.models import Task, TaskStatus, User, task_assignments
+        
+        # Uma única agregação por usuário/status via tabela de responsáveis; outer join mantém
+        # os usuários ativos sem tarefas (uma linha com status nulo e contagem zero)
+        results = self.db.session.query(
+            User.id, User.display_name, Task.status, Task.is_overdue, func.count(Task.id)
+        ).select_from(User).outerjoin(
+            task_assignments, task_assignments.c.user_azure_id == User.azure_id
+        ).outerjoin(
+            Task, Task.id == task_assignments.c.task_id
+        ).filter(
+            User.is_active == True
+        ).group_by(
+            User.id, User.display_name, Task.status, Task.is_overdue
+        ).all()
         
-        for user in users:
-            # Contar tarefas por status
-            tasks = Task.query.filter(
-                Task.assignments_json.like(f'%"userId": "{user.azure_id}"%')
-            ).all()
-            
-            if tasks:
-                workload_data.append({
-                    'user': user.display_name,
-                    'total': len(tasks),
-                    'completed': sum(1 for t in tasks if t.status == 'completed'),
-                    'in_progress': sum(1 for t in tasks if t.status == 'in_progress'),
-                    'overdue': sum(1 for t in tasks if t.is_overdue)
-                })
+        # Pivotar o resultado em colunas e somar por usuário (operações vetorizadas do pandas)
+        rows = pd.DataFrame(results, columns=['user_id', 'user', 'status', 'is_overdue', 'count'])
+        rows['completed'] = rows['count'].where(rows['status'] == TaskStatus.COMPLETED, 0)
+        rows['in_progress'] = rows['count'].where(rows['status'] == TaskStatus.IN_PROGRESS, 0)
+        rows['overdue'] = rows['count'].where(rows['is_overdue'].fillna(False).astype(bool), 0)
         
-        df = pd.DataFrame(workload_data)
+        df = rows.groupby(['user', 'user_id'], dropna=False)[
+            ['count', 'completed', 'in_progress', 'overdue']
+        ].sum().rename(columns={'count': 'total'}).reset_index()
         
         fig = go.Figure()
         
@@ -173,8 +238,9 @@ class AnalyticsService:
             xaxis_tickangle=-45
         )
         
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        return pio.to_json(fig, validate=False)
     
+    @cached_analytics()
     def get_burndown_chart(self, planner_id):
         """Gráfico de burndown para um planner"""
         from app.models import Task, Planner
@@ -183,42 +249,92 @@ class AnalyticsService:
         if not planner:
             return None
         
-        tasks = Task.query.filter_by(planner_id=planner_id).all()
+        rows = self.db.session.query(
+            Task.created_date, Task.due_date, Task.completed_date
+        ).filter(Task.planner_id == planner_id).all()
         
-        # Calcular burndown
-        start_date = min(t.created_date for t in tasks if t.created_date)
-        end_date = max(t.due_date for t in tasks if t.due_date)
+        created_dates = [created.date() for created, _, _ in rows if created]
+        due_dates = [due.date() for _, due, _ in rows if due]
+        if not created_dates or not due_dates:
+            return None
         
-        if not start_date or not end_date:
+        start_date = min(created_dates)
+        end_date = max(due_dates)
+        if end_date < start_date:
             return None
         
-        # Implementar lógica de burndown
-        # ...
+        # Tarefas sem data de criação contam desde o início do período
+        created = np.array(
+            [created.date() if created else start_date for created, _, _ in rows], dtype='datetime64[D]'
+        )
+        completed = np.array(
+            [completed.date() for _, _, completed in rows if completed], dtype='datetime64[D]'
+        )
+        days = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1)
+        
+        remaining = burndown_remaining(created, completed, days)
+        ideal = np.linspace(len(rows), 0, len(days))
+        
+        # Linha real só até hoje
+        actual_days = days <= np.datetime64(datetime.now().date(), 'D')
         
-        return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        fig = go.Figure()
+        
+        fig.add_trace(go.Scatter(
+            x=days,
+            y=ideal,
+            mode='lines',
+            name='Ideal',
+            line=dict(color='#6c757d', width=2, dash='dash')
+        ))
+        
+        fig.add_trace(go.Scatter(
+            x=days[actual_days],
+            y=remaining[actual_days],
+            mode='lines+markers',
+            name='Restantes',
+            line=dict(color='#dc3545', width=2),
+            marker=dict(size=6)
+        ))
+        
+        fig.update_layout(
+            title_text=f'Burndown - {planner.title}',
+            xaxis_title='Data',
+            yaxis_title='Tarefas Restantes',
+            height=400,
+            hovermode='x unified'
+        )
+        
+        return pio.to_json(fig, validate=False)
     
+    @cached_analytics()
     def get_kpis(self, user_id=None):
         """Retorna KPIs principais"""
-        from app.models import Task, Planner, Group
+        from app.models import Task, TaskStatus, Planner, Group
         
-        total_tasks = Task.query.count()
-        completed_tasks = Task.query.filter_by(status='completed').count()
-        overdue_tasks = Task.query.filter_by(is_overdue=True).count()
-        in_progress_tasks = Task.query.filter_by(status='in_progress').count()
-        
-        completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-        
-        # Tarefas criadas hoje
         today = datetime.now().date()
-        today_tasks = Task.query.filter(
-            func.date(Task.created_date) == today
-        ).count()
         
-        # Tarefas vencendo hoje
-        due_today = Task.query.filter(
-            func.date(Task.due_date) == today,
-            Task.status != 'completed'
-        ).count()
+        def count_if(condition):
+            return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+        
+        # Todos os contadores em um único SELECT (tuplas Core, sem hidratar objetos)
+        kpis = self.db.session.execute(
+            select(
+                func.count(Task.id),
+                count_if(Task.status == TaskStatus.COMPLETED),
+                count_if(Task.is_overdue == True),
+                count_if(Task.status == TaskStatus.IN_PROGRESS),
+                count_if(func.date(Task.created_date) == today),
+                count_if(and_(func.date(Task.due_date) == today, Task.status != TaskStatus.COMPLETED)),
+                select(func.count(Planner.id)).scalar_subquery(),
+                select(func.count(Group.id)).scalar_subquery()
+            )
+        ).one()
+        
+        (total_tasks, completed_tasks, overdue_tasks, in_progress_tasks,
+         today_tasks, due_today, total_planners, total_groups) = kpis
+        
+        completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
         
         return {
             'total_tasks': total_tasks,
@@ -228,6 +344,6 @@ class AnalyticsService:
             'completion_rate': f"{completion_rate:.1f}%",
             'today_tasks': today_tasks,
             'due_today': due_today,
-            'total_planners': Planner.query.count(),
-            'total_groups': Group.query.count()
+            'total_planners': total_planners,
+            'total_groups': total_groups
         }
\ No newline at end of file
@@ -1,15 +1,32 @@
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
+import mimetypes
+from email.message import EmailMessage
 from datetime import datetime
+from typing import List
 import logging
-from jinja2 import Template
+from flask import g, current_app
+from jinja2 import Environment
 from app.models import db, EmailTemplate, SystemSetting
 
 logger = logging.getLogger(__name__)
 
+# Ambientes compartilhados: HTML com autoescape, assunto/texto puro sem escape
+_html_env = Environment(autoescape=True)
+_text_env = Environment(autoescape=False)
+
+COMPILED_TEMPLATES_MAX = 256
+
+def get_email_service():
+    """Retorna o EmailService do contexto atual, criando-o uma única vez"""
+    service = getattr(g, '_email_service', None)
+    if service is None:
+        service = g._email_service = EmailService(current_app._get_current_object())
+    return service
+
 class EmailService:
+    # Templates compilados por (id, updated_at, campo), compartilhados entre instâncias
+    _compiled_templates = {}
+    
     def __init__(self, app=None):
         self.app = app
         if app:
@@ -24,61 +41,132 @@ class EmailService:
         self.use_tls = app.config.get('MAIL_USE_TLS', True)
         self.default_sender = app.config.get('MAIL_DEFAULT_SENDER')
     
-    def send_email(self, to_emails, subject, body_html, body_text=None, attachments=None, cc=None, bcc=None):
-        """Envia um email"""
+    def send_email(self, to_emails, subject, body_html, body_text=None, attachments=None, cc=None, bcc=None,
+                   background=True):
+        """Envia um email (por padrão enfileirado no Celery, sem bloquear a requisição)"""
+        if not self.smtp_server or not self.smtp_username:
+            logger.warning("Configuração de email não definida")
+            return False
+        
+        if not background:
+            return self.deliver_email(to_emails, subject, body_html, body_text, attachments, cc, bcc)
+        
+        try:
+            from app.tasks.email_tasks import send_email_task
+            send_email_task.delay(to_emails, subject, body_html, body_text, attachments, cc, bcc)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Erro ao enfileirar email: {str(e)}")
+            return False
+    
+    def deliver_email(self, to_emails, subject, body_html, body_text=None, attachments=None, cc=None, bcc=None,
+                      raise_errors=False):
+        """Envia um email diretamente pelo SMTP"""
         try:
             if not self.smtp_server or not self.smtp_username:
                 logger.warning("Configuração de email não definida")
                 return False
             
-            # Criar mensagem
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.default_sender
-            msg['To'] = ', '.join(to_emails) if isinstance(to_emails, list) else to_emails
-            
-            if cc:
-                msg['Cc'] = ', '.join(cc) if isinstance(cc, list) else cc
-            
-            # Adicionar corpo
-            if body_text:
-                part1 = MIMEText(body_text, 'plain')
-                msg.attach(part1)
-            
-            part2 = MIMEText(body_html, 'html')
-            msg.attach(part2)
+            msg = self._build_message(to_emails, subject, body_html, body_text, attachments, cc)
             
-            # Adicionar anexos
-            if attachments:
-                for attachment in attachments:
-                    with open(attachment['path'], 'rb') as f:
-                        part = MIMEApplication(f.read(), Name=attachment['filename'])
-                    part['Content-Disposition'] = f'attachment; filename="{attachment["filename"]}"'
-                    msg.attach(part)
+            # Destinatários do envelope (inclui BCC, que não vai nos cabeçalhos)
+            recipients = self._as_tuple(to_emails) + self._as_tuple(cc) + self._as_tuple(bcc)
             
             # Enviar email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                if self.use_tls:
-                    server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                
-                recipients = to_emails
-                if cc:
-                    recipients.extend(cc)
-                if bcc:
-                    recipients.extend(bcc)
-                
-                server.send_message(msg)
+            with self._connect() as server:
+                server.send_message(msg, to_addrs=recipients)
             
             logger.info(f"Email enviado para {to_emails}")
             return True
             
         except Exception as e:
             logger.error(f"Erro ao enviar email: {str(e)}")
+            if raise_errors:
+                raise
             return False
     
-    def send_task_notification(self, task, notification_type, recipients):
-        """Envia notificação sobre uma tarefa"""
+    def send_bulk(self, messages: List[EmailMessage]) -> int:
+        """Envia várias mensagens reutilizando uma única conexão SMTP"""
+        if not messages:
+            return 0
+        
+        if not self.smtp_server or not self.smtp_username:
+            logger.warning("Configuração de email não definida")
+            return 0
+        
+        sent = 0
+        try:
+            with self._connect() as server:
+                for msg in messages:
+                    try:
+                        server.send_message(msg)
+                        sent += 1
+                    except Exception as e:
+                        # Falha de um destinatário não interrompe o lote
+                        logger.error(f"Erro ao enviar email para {msg['To']}: {str(e)}")
+            
+        except Exception as e:
+            logger.error(f"Erro na conexão SMTP do envio em lote: {str(e)}")
+        
+        logger.info(f"Envio em lote: {sent}/{len(messages)} emails enviados")
+        return sent
+    
+    @staticmethod
+    def _as_tuple(emails):
+        """Normaliza um endereço ou lista de endereços em tupla, sem alterar o original"""
+        if not emails:
+            return ()
+        if isinstance(emails, str):
+            return (emails,)
+        return tuple(emails)
+    
+    def _connect(self):
+        """Abre conexão SMTP autenticada"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            if self.use_tls:
+                server.starttls()
+            server.login(self.smtp_username, self.smtp_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    def _build_message(self, to_emails, subject, body_html, body_text=None, attachments=None, cc=None):
+        """Monta a mensagem de email"""
+        msg = EmailMessage()
+        msg['Subject'] = subject
+        msg['From'] = self.default_sender
+        msg['To'] = ', '.join(self._as_tuple(to_emails))
+        
+        if cc:
+            msg['Cc'] = ', '.join(self._as_tuple(cc))
+        
+        # Adicionar corpo
+        if body_text:
+            msg.set_content(body_text)
+            msg.add_alternative(body_html, subtype='html')
+        else:
+            msg.set_content(body_html, subtype='html')
+        
+        # Adicionar anexos (os bytes lidos são descartados logo após a codificação)
+        if attachments:
+            for attachment in attachments:
+                ctype, _ = mimetypes.guess_type(attachment['filename'])
+                maintype, subtype = (ctype or 'application/octet-stream').split('/', 1)
+                with open(attachment['path'], 'rb') as f:
+                    msg.add_attachment(
+                        f.read(),
+                        maintype=maintype,
+                        subtype=subtype,
+                        filename=attachment['filename']
+                    )
+        
+        return msg
+    
+    def send_task_notification(self, task, notification_type, recipients, background=True, bcc=False):
+        """Envia notificação sobre uma tarefa (bcc=True: uma única mensagem com os destinatários ocultos)"""
         try:
             template = self.get_template(f"task_{notification_type}")
             if not template:
@@ -97,16 +185,24 @@ class EmailService:
                 'app_url': self.app.config.get('APP_BASE_URL', '')
             }
             
-            subject = self._render_template(template.subject, context)
-            body_html = self._render_template(template.body_html, context)
-            body_text = self._render_template(template.body, context)
+            subject = self._render_template(template, 'subject', context)
+            body_html = self._render_template(template, 'body_html', context)
+            body_text = self._render_template(template, 'body', context)
+            
+            # Em cópia oculta o cabeçalho To fica com o remetente e os destinatários vão só no envelope
+            if bcc:
+                to_emails, bcc_emails = self.default_sender or self.smtp_username, recipients
+            else:
+                to_emails, bcc_emails = recipients, None
             
             # Enviar email
             return self.send_email(
-                to_emails=recipients,
+                to_emails=to_emails,
                 subject=subject,
                 body_html=body_html,
-                body_text=body_text
+                body_text=body_text,
+                bcc=bcc_emails,
+                background=background
             )
             
         except Exception as e:
@@ -120,18 +216,7 @@ class EmailService:
             if not template:
                 return False
             
-            context = {
-                'user': user,
-                'tasks_due': tasks_due,
-                'tasks_overdue': tasks_overdue,
-                'tasks_completed': tasks_completed,
-                'date': datetime.now().strftime('%d/%m/%Y'),
-                'total_tasks': len(tasks_due) + len(tasks_overdue) + len(tasks_completed),
-                'app_url': self.app.config.get('APP_BASE_URL', '')
-            }
-            
-            subject = self._render_template(template.subject, context)
-            body_html = self._render_template(template.body_html, context)
+            subject, body_html = self._render_daily_digest(template, user, tasks_due, tasks_overdue, tasks_completed)
             
             return self.send_email(
                 to_emails=[user.email],
@@ -143,6 +228,29 @@ class EmailService:
             logger.error(f"Erro ao enviar resumo diário: {str(e)}")
             return False
     
+    def build_daily_digest(self, user, tasks_due, tasks_overdue, tasks_completed, template=None):
+        """Monta a mensagem do resumo diário sem enviá-la (para uso com send_bulk)"""
+        template = template or self.get_template("daily_digest")
+        if not template:
+            return None
+        
+        subject, body_html = self._render_daily_digest(template, user, tasks_due, tasks_overdue, tasks_completed)
+        return self._build_message([user.email], subject, body_html)
+    
+    def _render_daily_digest(self, template, user, tasks_due, tasks_overdue, tasks_completed):
+        """Renderiza assunto e corpo do resumo diário"""
+        context = {
+            'user': user,
+            'tasks_due': tasks_due,
+            'tasks_overdue': tasks_overdue,
+            'tasks_completed': tasks_completed,
+            'date': datetime.now().strftime('%d/%m/%Y'),
+            'total_tasks': len(tasks_due) + len(tasks_overdue) + len(tasks_completed),
+            'app_url': self.app.config.get('APP_BASE_URL', '')
+        }
+        
+        return self._render_template(template, 'subject', context), self._render_template(template, 'body_html', context)
+    
     def send_report_email(self, report, report_path, recipients):
         """Envia relatório por email"""
         try:
@@ -166,8 +274,8 @@ class EmailService:
                 'app_url': self.app.config.get('APP_BASE_URL', '')
             }
             
-            subject = self._render_template(template.subject, context)
-            body_html = self._render_template(template.body_html, context)
+            subject = self._render_template(template, 'subject', context)
+            body_html = self._render_template(template, 'body_html', context)
             
             attachments = [{
                 'filename': f"{report.name}.xlsx",
@@ -189,13 +297,22 @@ class EmailService:
         """Obtém template de email"""
         return EmailTemplate.query.filter_by(name=template_name, is_active=True).first()
     
-    def _render_template(self, template_string, context):
-        """Renderiza template com contexto"""
-        if not template_string:
+    def _render_template(self, template, field, context):
+        """Renderiza um campo do template com contexto, compilando-o uma única vez"""
+        source = getattr(template, field)
+        if not source:
             return ""
         
-        template = Template(template_string)
-        return template.render(**context)
+        # Templates não persistidos (sem id) são identificados pelo próprio texto
+        key = (template.id, template.updated_at, field) if template.id else (None, source, field)
+        compiled = self._compiled_templates.get(key)
+        if compiled is None:
+            if len(self._compiled_templates) >= COMPILED_TEMPLATES_MAX:
+                self._compiled_templates.clear()
+            env = _html_env if field == 'body_html' else _text_env
+            compiled = self._compiled_templates[key] = env.from_string(source)
+        
+        return compiled.render(**context)
     
     def _get_task_assignees(self, task):
         """Obtém lista de responsáveis pela tarefa"""
@@ -1,11 +1,56 @@
+import orjson
 import requests
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta
 import logging
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import random
 import time
 
 logger = logging.getLogger(__name__)
 
+# Limite de sub-requisições por chamada ao /$batch do Graph
+GRAPH_BATCH_LIMIT = 20
+
+# Campos do usuário usados na sincronização dos responsáveis
+USER_SELECT = 'id,displayName,mail,userPrincipalName,jobTitle,department,mobilePhone,businessPhones'
+
+# Retornado por make_request quando o recurso não mudou desde o ETag informado (304)
+NOT_MODIFIED = object()
+
+# Cache de respostas GET por instância (endpoints de leitura chamados várias vezes no mesmo fluxo)
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 300  # segundos
+
+# Detalhes de usuários (responsáveis em vários planners): encontrados por 1 h, ausentes/erro por 5 min
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 3600
+USER_MISSING_TTL = 300
+
+# Sessão HTTP compartilhada pelo processo: cada instância (uma por requisição/sincronização)
+# reaproveita as conexões TCP/TLS já abertas com o Graph em vez de refazer o handshake
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def _get_http_session() -> requests.Session:
+    """Sessão HTTP única do processo, criada sob demanda"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                # Autenticação vai por requisição; cookies nunca são guardados (sessão compartilhada entre usuários)
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                session.headers['Accept-Encoding'] = 'gzip, deflate'
+                adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=0)
+                session.mount('https://', adapter)
+                _http_session = session
+    return _http_session
+
 class MicrosoftPlannerAPI:
     def __init__(self, access_token: str):
         self.access_token = access_token
@@ -16,104 +61,256 @@ class MicrosoftPlannerAPI:
         }
         # Configurações de retry
         self.max_retries = 3
-        self.retry_delay = 2  # segundos
-    
-    def make_request(self, endpoint: str, params: Dict = None, method: str = 'GET', data: Dict = None, retry_count: int = 0):
-        """Faz requisição para Microsoft Graph API com retry automático"""
-        url = f"{self.base_url}{endpoint}"
-        
-        try:
-            if method == 'GET':
-                response = requests.get(url, headers=self.headers, params=params, timeout=30)
-            elif method == 'POST':
-                response = requests.post(url, headers=self.headers, json=data, timeout=30)
-            elif method == 'PATCH':
-                response = requests.patch(url, headers=self.headers, json=data, timeout=30)
-            elif method == 'DELETE':
-                response = requests.delete(url, headers=self.headers, timeout=30)
-            else:
-                raise ValueError(f"Método HTTP não suportado: {method}")
-            
-            response.raise_for_status()
-            
-            if response.status_code == 204:  # No Content
-                return True
-            
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            # Verificar se é um erro que vale a pena tentar novamente
-            should_retry = False
-            
-            if hasattr(e, 'response') and e.response is not None:
-                status_code = e.response.status_code
+        self.retry_delay = 2  # segundos (base do backoff exponencial)
+        self.retry_max_delay = 30  # teto do backoff
+        self.retry_jitter = 1  # segundos aleatórios somados à espera
+        
+        # Sessão HTTP persistente e compartilhada: reaproveita conexões TCP/TLS com o Graph
+        self.session = _get_http_session()
+        
+        # Respostas já obtidas; o lock protege o cache nas buscas concorrentes
+        self._cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+        self._cache_lock = threading.Lock()
+        
+        # Usuários por azure_id; não são descartados por clear_cache (escritas no Planner não os alteram)
+        self._user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        self._missing_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_MISSING_TTL)
+    
+    def make_request(self, endpoint: str, params: Dict = None, method: str = 'GET', data: Dict = None,
+                     etag: str = None):
+        """Faz requisição para Microsoft Graph API com retry automático (GET condicional se etag for informado)"""
+        # @odata.nextLink já vem como URL absoluta
+        url = endpoint if endpoint.startswith('https://') else f"{self.base_url}{endpoint}"
+        
+        # GETs condicionais não usam o cache: o chamador quer saber se o recurso mudou
+        cache_key = None
+        if method == 'GET' and not etag:
+            cache_key = (endpoint, tuple(sorted((params or {}).items())))
+            with self._cache_lock:
+                cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        if method not in ('GET', 'POST', 'PATCH', 'DELETE'):
+            raise ValueError(f"Método HTTP não suportado: {method}")
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                headers = {**self.headers, 'If-None-Match': etag} if etag else self.headers
+                response = self.session.request(method, url, params=params, json=data, headers=headers, timeout=30)
+                
+                response.raise_for_status()
+                
+                if response.status_code == 304:  # Not Modified: nada a baixar nem a processar
+                    return NOT_MODIFIED
+                
+                # Escritas podem alterar qualquer leitura já em cache
+                if method != 'GET' and endpoint != '/$batch':
+                    self.clear_cache()
+                
+                if response.status_code == 204:  # No Content
+                    return True
+                
+                try:
+                    result = orjson.loads(response.content)
+                except orjson.JSONDecodeError as e:
+                    logger.error(f"Resposta inválida (não JSON) de {url}: {str(e)}")
+                    return None
+                
+                if cache_key is not None:
+                    with self._cache_lock:
+                        self._cache[cache_key] = result
                 
-                # Erros temporários que vale a pena tentar novamente
-                if status_code in [429, 502, 503, 504]:  # Too Many Requests, Bad Gateway, Service Unavailable, Gateway Timeout
-                    should_retry = True
-                    error_name = {
-                        429: "Rate Limit (429)",
-                        502: "Bad Gateway (502)",
-                        503: "Service Unavailable (503)",
-                        504: "Gateway Timeout (504)"
-                    }.get(status_code, f"Erro {status_code}")
+                return result
+                
+            except requests.exceptions.RequestException as e:
+                # Verificar se é um erro que vale a pena tentar novamente
+                should_retry = False
+                
+                if hasattr(e, 'response') and e.response is not None:
+                    status_code = e.response.status_code
                     
-                    logger.warning(f"{error_name} na requisição para {url}")
-                elif status_code == 404:
-                    # NOVO: 404 é esperado para recursos que não existem (não é erro grave)
-                    logger.debug(f"Recurso não encontrado (404): {url}")
+                    # Erros temporários que vale a pena tentar novamente
+                    if status_code in [429, 502, 503, 504]:  # Too Many Requests, Bad Gateway, Service Unavailable, Gateway Timeout
+                        should_retry = True
+                        error_name = {
+                            429: "Rate Limit (429)",
+                            502: "Bad Gateway (502)",
+                            503: "Service Unavailable (503)",
+                            504: "Gateway Timeout (504)"
+                        }.get(status_code, f"Erro {status_code}")
+                        
+                        logger.warning(f"{error_name} na requisição para {url}")
+                    elif status_code == 404:
+                        # NOVO: 404 é esperado para recursos que não existem (não é erro grave)
+                        logger.debug(f"Recurso não encontrado (404): {url}")
+                    else:
+                        logger.error(f"Erro na requisição para {url}: {str(e)}")
+                    
+                    # Log da resposta de erro apenas se não for 502 ou 404 (evita poluir logs)
+                    if status_code not in [502, 404]:
+                        logger.error(f"Resposta de erro: {e.response.text[:500]}")  # Limitar tamanho do log
                 else:
-                    logger.error(f"Erro na requisição para {url}: {str(e)}")
+                    # Erros de timeout também podem ser tentados novamente
+                    if isinstance(e, requests.exceptions.Timeout):
+                        should_retry = True
+                        logger.warning(f"Timeout na requisição para {url}")
+                    else:
+                        logger.error(f"Erro na requisição para {url}: {str(e)}")
                 
-                # Log da resposta de erro apenas se não for 502 ou 404 (evita poluir logs)
-                if status_code not in [502, 404]:
-                    logger.error(f"Resposta de erro: {e.response.text[:500]}")  # Limitar tamanho do log
-            else:
-                # Erros de timeout também podem ser tentados novamente
-                if isinstance(e, requests.exceptions.Timeout):
-                    should_retry = True
-                    logger.warning(f"Timeout na requisição para {url}")
-                else:
-                    logger.error(f"Erro na requisição para {url}: {str(e)}")
-            
-            # Tentar novamente se apropriado
-            if should_retry and retry_count < self.max_retries:
-                retry_count += 1
-                wait_time = self.retry_delay * retry_count  # Backoff exponencial
-                logger.info(f"Tentando novamente em {wait_time}s... (tentativa {retry_count}/{self.max_retries})")
+                # Tentar novamente se apropriado
+                if not should_retry or attempt == self.max_retries:
+                    return None
+                
+                wait_time = self._retry_wait(e, attempt)
+                logger.info(f"Tentando novamente em {wait_time:.1f}s... (tentativa {attempt + 1}/{self.max_retries})")
                 time.sleep(wait_time)
-                return self.make_request(endpoint, params, method, data, retry_count)
-            
-            return None
+    
+    def _retry_wait(self, error: requests.exceptions.RequestException, retry_count: int) -> float:
+        """Tempo de espera antes da próxima tentativa: Retry-After do Graph ou backoff exponencial com jitter"""
+        response = getattr(error, 'response', None)
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return max(float(retry_after), 0)
+                except ValueError:
+                    pass  # formato de data HTTP: usa o backoff
+        
+        backoff = min(self.retry_max_delay, self.retry_delay * 2 ** retry_count)
+        return backoff + random.uniform(0, self.retry_jitter)
+    
+    def clear_cache(self):
+        """Descarta as respostas GET em cache"""
+        with self._cache_lock:
+            self._cache.clear()
     
     def get_me(self):
         """Obtém informações do usuário atual"""
         return self.make_request('/me')
     
     def get_groups(self, limit: int = 100):
-        """Lista grupos do usuário"""
+        """Lista grupos do usuário (só a primeira página; para todos use iter_group_pages)"""
         params = {
             '$top': limit,
             '$select': 'id,displayName,mail,description,groupTypes,visibility,createdDateTime'
         }
         return self.make_request('/me/transitiveMemberOf/microsoft.graph.group', params)
     
+    def iter_group_pages(self, limit: int = 100):
+        """Itera os grupos do usuário página a página ($top itens por página), seguindo @odata.nextLink"""
+        params = {
+            '$top': limit,
+            '$select': 'id,displayName,mail,description,groupTypes,visibility,createdDateTime'
+        }
+        return self.iter_page_values('/me/transitiveMemberOf/microsoft.graph.group', params)
+    
     def get_planners(self, group_id: str):
-        """Lista planners de um grupo"""
-        return self.make_request(f'/groups/{group_id}/planner/plans')
+        """Lista planners de um grupo (todas as páginas)"""
+        return {'value': list(self.iter_pages(f'/groups/{group_id}/planner/plans'))}
+    
+    def get_planner_details(self, plan_id: str, etag: str = None):
+        """Obtém detalhes de um planner (NOT_MODIFIED se o etag ainda for válido)"""
+        return self.make_request(f'/planner/plans/{plan_id}', etag=etag)
     
-    def get_planner_details(self, plan_id: str):
-        """Obtém detalhes de um planner"""
-        return self.make_request(f'/planner/plans/{plan_id}')
+    def get_planner_tasks(self, plan_id: str):
+        """Lista tarefas de um planner (todas as páginas)"""
+        return {'value': list(self.iter_planner_tasks(plan_id))}
+    
+    def iter_planner_tasks(self, plan_id: str, first_page: Dict = None):
+        """Itera as tarefas de um planner página a página"""
+        return self.iter_pages(f'/planner/plans/{plan_id}/tasks', first_page=first_page)
+    
+    def iter_planner_task_pages(self, plan_id: str, first_page: Dict = None):
+        """Itera as páginas (listas de tarefas) de um planner"""
+        return self.iter_page_values(f'/planner/plans/{plan_id}/tasks', first_page=first_page)
+    
+    def iter_pages(self, endpoint: str, params: Dict = None, first_page: Dict = None):
+        """Itera os itens de uma coleção seguindo @odata.nextLink"""
+        for values in self.iter_page_values(endpoint, params, first_page):
+            yield from values
+    
+    def iter_page_values(self, endpoint: str, params: Dict = None, first_page: Dict = None):
+        """Itera os itens de uma coleção página a página (uma lista por página)"""
+        page = first_page if first_page is not None else self.make_request(endpoint, params)
+        while page:
+            yield page.get('value', [])
+            next_link = page.get('@odata.nextLink')
+            page = self.make_request(next_link) if next_link else None
+    
+    def get_task_details(self, task_id: str, etag: str = None):
+        """Obtém detalhes de uma tarefa (NOT_MODIFIED se o etag ainda for válido)"""
+        return self.make_request(f'/planner/tasks/{task_id}', etag=etag)
+    
+    def get_tasks_bulk(self, task_ids: List[str], workers: int = 8) -> Dict[str, dict]:
+        """Obtém detalhes de várias tarefas em paralelo"""
+        return self.fetch_concurrently(self.get_task_details, task_ids, workers)
+    
+    def fetch_concurrently(self, fetch: Callable[[str], Optional[dict]], keys: List[str],
+                           workers: int = 8) -> Dict[str, Optional[dict]]:
+        """Executa fetch(key) para cada chave em um pool limitado de threads"""
+        results = {}
+        if not keys:
+            return results
+        
+        with ThreadPoolExecutor(max_workers=min(workers, len(keys))) as pool:
+            futures = {pool.submit(fetch, key): key for key in keys}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    logger.error(f"Erro ao buscar {key}: {str(e)}")
+                    results[key] = None
+        
+        return results
     
-    def get_planner_tasks(self, plan_id: str, limit: int = 1000):
-        """Lista tarefas de um planner"""
-        params = {'$top': limit}
-        return self.make_request(f'/planner/plans/{plan_id}/tasks', params)
+    def batch(self, requests_: List[Dict]) -> List[Optional[dict]]:
+        """Executa várias requisições via /$batch (até 20 por chamada), na ordem recebida"""
+        results = [None] * len(requests_)
+        
+        if any(item.get('method', 'GET') != 'GET' for item in requests_):
+            self.clear_cache()
+        
+        for start in range(0, len(requests_), GRAPH_BATCH_LIMIT):
+            chunk = requests_[start:start + GRAPH_BATCH_LIMIT]
+            payload = {'requests': []}
+            for offset, item in enumerate(chunk):
+                sub_request = {
+                    'id': str(start + offset),
+                    'method': item.get('method', 'GET'),
+                    'url': item['url']
+                }
+                if item.get('body') is not None:
+                    sub_request['body'] = item['body']
+                    sub_request['headers'] = {'Content-Type': 'application/json'}
+                payload['requests'].append(sub_request)
+            
+            response = self.make_request('/$batch', method='POST', data=payload)
+            if not response:
+                continue
+            
+            for sub_response in response.get('responses', []):
+                status = sub_response.get('status', 500)
+                if 200 <= status < 300:
+                    results[int(sub_response['id'])] = sub_response.get('body', True)
+                else:
+                    logger.warning(f"Erro {status} no $batch para {requests_[int(sub_response['id'])]['url']}")
+        
+        return results
     
-    def get_task_details(self, task_id: str):
-        """Obtém detalhes de uma tarefa"""
-        return self.make_request(f'/planner/tasks/{task_id}')
+    def get_plans_content(self, plan_ids: List[str]) -> Dict[str, Dict]:
+        """Obtém buckets e tarefas de vários planners em lotes de $batch"""
+        requests_ = []
+        for plan_id in plan_ids:
+            requests_.append({'url': f'/planner/plans/{plan_id}/buckets'})
+            requests_.append({'url': f'/planner/plans/{plan_id}/tasks'})
+        
+        responses = self.batch(requests_)
+        return {
+            plan_id: {'buckets': responses[2 * index], 'tasks': responses[2 * index + 1]}
+            for index, plan_id in enumerate(plan_ids)
+        }
     
     def get_buckets(self, plan_id: str):
         """Lista buckets de um planner"""
@@ -148,8 +345,52 @@ class MicrosoftPlannerAPI:
         return self.make_request(f'/planner/tasks/{task_id}/progressTaskBoardFormat')
     
     def get_user_details(self, user_id: str):
-        """Obtém detalhes de um usuário"""
-        return self.make_request(f'/users/{user_id}')
+        """Obtém detalhes de um usuário (em cache; None = não encontrado ou erro)"""
+        found, user = self._get_cached_user(user_id)
+        if found:
+            return user
+        
+        user = self.make_request(f'/users/{user_id}')
+        self._cache_user(user_id, user)
+        return user
+    
+    def get_users_batch(self, user_ids: List[str]) -> Dict[str, Optional[dict]]:
+        """Obtém detalhes de vários usuários via $batch (None = não encontrado ou erro)"""
+        users = {}
+        pending = []
+        for user_id in user_ids:
+            found, user = self._get_cached_user(user_id)
+            if found:
+                users[user_id] = user
+            else:
+                pending.append(user_id)
+        
+        if pending:
+            responses = self.batch([
+                {'url': f'/users/{user_id}?$select={USER_SELECT}'} for user_id in pending
+            ])
+            for user_id, user in zip(pending, responses):
+                self._cache_user(user_id, user)
+                users[user_id] = user
+        
+        return users
+    
+    def _get_cached_user(self, user_id: str):
+        """Retorna (encontrado no cache, dados do usuário ou None)"""
+        with self._cache_lock:
+            user = self._user_cache.get(user_id)
+            if user is not None:
+                return True, user
+            return user_id in self._missing_user_cache, None
+    
+    def _cache_user(self, user_id: str, user: Optional[dict]):
+        """Guarda o usuário; ausentes (404/erro) ficam pouco tempo para não repetir a busca a cada tarefa"""
+        with self._cache_lock:
+            if user:
+                self._user_cache[user_id] = user
+                self._missing_user_cache.pop(user_id, None)
+            else:
+                self._missing_user_cache[user_id] = True
     
     def search_users(self, query: str, limit: int = 20):
         """Busca usuários no Azure AD"""
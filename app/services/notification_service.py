@@ -1,13 +1,66 @@
 import logging
+import threading
 from datetime import datetime, timedelta
+from flask import g, current_app
 from typing import List, Dict, Any
-from sqlalchemy import or_, and_
+from collections import Counter, namedtuple
+from cachetools import TTLCache
+from celery import group
+from sqlalchemy import or_, and_, func, insert, update, select, event, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm.attributes import get_history
 
-from app.models import db, Notification, User, Task, TaskStatus, NotificationType
+from app import cache, cache_is_shared
+from app.models import (
+    db, Notification, User, Task, TaskStatus, NotificationType, task_assignments,
+    NOTIFICATION_TOTAL_KEY, NOTIFICATION_UNREAD_KEY, bump_notification_counter
+)
 from app.services.email_service import EmailService
+from app.tasks.email_tasks import send_task_notification_task
 
 logger = logging.getLogger(__name__)
 
+NOTIFICATION_COUNT_TIMEOUT = 3600
+NOTIFICATION_INSERT_BATCH = 1000
+DIGEST_USERS_BATCH = 500
+NOTIFICATION_ARCHIVE_BATCH = 5000
+
+# Lembrete de vencimento já enviado (tarefa, antecedência, vencimento): evita repetir a cada execução do cron
+DUE_NOTIFICATION_SENT_KEY = 'notif:due_sent:{}:{}:{}'
+
+# Dados do destinatário por azure_id, em cache local ao processo (expira em 10 min)
+NotificationRecipient = namedtuple('NotificationRecipient', 'id azure_id email email_notifications')
+_recipient_cache = TTLCache(maxsize=1024, ttl=600)
+_recipient_cache_lock = threading.Lock()
+
+# Lista de gerentes/admins (muda raramente), renovada a cada 5 min
+_managers_cache = TTLCache(maxsize=1, ttl=300)
+MANAGER_FIELDS = ('is_admin', 'department', 'email', 'email_notifications')
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_recipient_cache(mapper, connection, target):
+    """Remove o usuário alterado do cache de destinatários"""
+    with _recipient_cache_lock:
+        _recipient_cache.pop(target.azure_id, None)
+        if any(get_history(target, field).has_changes() for field in MANAGER_FIELDS):
+            _managers_cache.clear()
+
+@event.listens_for(User, 'after_insert')
+def invalidate_managers_cache(mapper, connection, target):
+    """Novo admin/gerente entra na próxima notificação"""
+    if target.is_admin or target.department == 'Management':
+        with _recipient_cache_lock:
+            _managers_cache.clear()
+
+def get_notification_service():
+    """Retorna o NotificationService do contexto atual, criando-o uma única vez"""
+    service = getattr(g, '_notification_service', None)
+    if service is None:
+        service = g._notification_service = NotificationService(current_app._get_current_object())
+    return service
+
 class NotificationService:
     def __init__(self, app=None):
         self.app = app
@@ -23,12 +76,12 @@ class NotificationService:
             if not assignment_info:
                 return False
             
-            user = User.query.filter_by(azure_id=assignee_id).first()
+            user = self._get_users_by_azure_ids([assignee_id]).get(assignee_id)
             if not user or not user.email:
                 return False
             
-            # Criar notificação no banco
-            notification = Notification(
+            # Criar notificação no banco (ignorada se já existir hoje)
+            inserted = self._insert_notifications([dict(
                 user_id=user.id,
                 title='Nova tarefa atribuída',
                 message=f'Você foi atribuído à tarefa: {task.title}',
@@ -36,19 +89,16 @@ class NotificationService:
                 action_url=f'/tasks/{task.id}',
                 action_text='Ver Tarefa',
                 entity_type='task',
-                entity_id=task.id
-            )
-            db.session.add(notification)
-            
-            # Enviar email se configurado
-            if user.email_notifications and self.email_service:
-                self.email_service.send_task_notification(
-                    task=task,
-                    notification_type='assigned',
-                    recipients=[user.email]
-                )
+                entity_id=task.id,
+                created_at=datetime.utcnow()
+            )])
             
             db.session.commit()
+            self._bump_notification_counters(inserted)
+            
+            # Enviar email se configurado (só depois do commit)
+            if user.id in inserted and user.email_notifications and user.email:
+                self._queue_task_emails(task.id, 'assigned', [user.email])
             return True
             
         except Exception as e:
@@ -61,37 +111,68 @@ class NotificationService:
             if not task.due_date or task.status == TaskStatus.COMPLETED:
                 return False
             
+            # Um único instante para a verificação e para todas as linhas do lote
+            now = datetime.utcnow()
+            
             # Verificar se a tarefa está próxima do vencimento
-            time_until_due = task.due_date - datetime.utcnow()
+            time_until_due = task.due_date - now
             if timedelta(hours=0) < time_until_due <= timedelta(hours=hours_before):
                 
+                # Deduplicação garantida pelo índice único ux_notif_task_daily (ON CONFLICT DO NOTHING):
+                # só quem inseriu a linha envia o email. Com cache compartilhado (Redis), o add (NX) é só
+                # um atalho que evita montar o lote na janela; um SimpleCache é por processo e não serve
+                shared = cache_is_shared()
+                sent_key = DUE_NOTIFICATION_SENT_KEY.format(task.id, hours_before, task.due_date.isoformat())
+                if shared and not cache.add(sent_key, 1, timeout=hours_before * 3600):
+                    return False
+                
                 # Notificar todos os responsáveis
                 assignments = task.get_assignments()
+                users = self._get_users_by_azure_ids(assignments.keys())
+                
+                # Valores comuns a todas as linhas, lidos da tarefa uma única vez
+                task_id = task.id
+                message = f'A tarefa "{task.title}" vence em {hours_before}h'
+                action_url = f'/tasks/{task_id}'
+                
+                notifications = []
+                emails = {}
                 for user_id, assignment_info in assignments.items():
-                    user = User.query.filter_by(azure_id=user_id).first()
+                    user = users.get(user_id)
                     if user:
                         # Criar notificação
-                        notification = Notification(
+                        notifications.append(dict(
                             user_id=user.id,
                             title='Tarefa próxima do vencimento',
-                            message=f'A tarefa "{task.title}" vence em {hours_before}h',
+                            message=message,
                             notification_type=NotificationType.WARNING,
-                            action_url=f'/tasks/{task.id}',
+                            action_url=action_url,
                             action_text='Ver Tarefa',
                             entity_type='task',
-                            entity_id=task.id
-                        )
-                        db.session.add(notification)
+                            entity_id=task_id,
+                            created_at=now
+                        ))
                         
                         # Enviar email
-                        if user.email_notifications and self.email_service:
-                            self.email_service.send_task_notification(
-                                task=task,
-                                notification_type='due_reminder',
-                                recipients=[user.email]
-                            )
+                        if user.email_notifications and user.email:
+                            emails[user.id] = user.email
+                
+                try:
+                    inserted = self._insert_notifications(notifications)
+                    db.session.commit()
+                except Exception:
+                    # Libera a marca para que a próxima execução tente de novo
+                    if shared:
+                        cache.delete(sent_key)
+                    raise
                 
-                db.session.commit()
+                self._bump_notification_counters(inserted)
+                
+                # Outro worker já registrou o lembrete hoje
+                if notifications and not inserted:
+                    return False
+                
+                self._queue_task_emails(task_id, 'due_reminder', [emails[uid] for uid in inserted if uid in emails])
                 return True
             
             return False
@@ -106,35 +187,49 @@ class NotificationService:
             if not task.is_overdue or task.status == TaskStatus.COMPLETED:
                 return False
             
+            now = datetime.utcnow()
             assignments = task.get_assignments()
+            users = self._get_users_by_azure_ids(assignments.keys())
+            
+            task_id = task.id
+            message = f'A tarefa "{task.title}" está atrasada'
+            action_url = f'/tasks/{task_id}'
+            
+            notifications = []
+            emails = {}
             for user_id, assignment_info in assignments.items():
-                user = User.query.filter_by(azure_id=user_id).first()
+                user = users.get(user_id)
                 if user:
                     # Criar notificação
-                    notification = Notification(
+                    notifications.append(dict(
                         user_id=user.id,
                         title='Tarefa atrasada',
-                        message=f'A tarefa "{task.title}" está atrasada',
+                        message=message,
                         notification_type=NotificationType.ERROR,
-                        action_url=f'/tasks/{task.id}',
+                        action_url=action_url,
                         action_text='Ver Tarefa',
                         entity_type='task',
-                        entity_id=task.id
-                    )
-                    db.session.add(notification)
+                        entity_id=task_id,
+                        created_at=now
+                    ))
                     
                     # Enviar email
-                    if user.email_notifications and self.email_service:
-                        self.email_service.send_task_notification(
-                            task=task,
-                            notification_type='overdue',
-                            recipients=[user.email]
-                        )
+                    if user.email_notifications and user.email:
+                        emails[user.id] = user.email
+            
+            inserted = self._insert_notifications(notifications)
+            db.session.commit()
+            self._bump_notification_counters(inserted)
+            
+            # Outro worker já notificou esta tarefa hoje
+            if notifications and not inserted:
+                return False
+            
+            # Emails só depois do commit: a transação não espera pelo enfileiramento
+            self._queue_task_emails(task_id, 'overdue', [emails[uid] for uid in inserted if uid in emails])
             
             # Notificar também o gerente/administrador
             self._notify_managers_about_overdue_task(task)
-            
-            db.session.commit()
             return True
             
         except Exception as e:
@@ -147,27 +242,39 @@ class NotificationService:
             if task.status != TaskStatus.COMPLETED:
                 return False
             
+            now = datetime.utcnow()
+            
             # Notificar todos os responsáveis
             assignments = task.get_assignments()
+            users = self._get_users_by_azure_ids(assignments.keys())
+            
+            task_id = task.id
+            completed_by_id = completed_by.id
+            message = f'A tarefa "{task.title}" foi concluída por {completed_by.display_name}'
+            action_url = f'/tasks/{task_id}'
+            
+            notifications = []
             for user_id, assignment_info in assignments.items():
-                user = User.query.filter_by(azure_id=user_id).first()
-                if user and user.id != completed_by.id:
-                    notification = Notification(
+                user = users.get(user_id)
+                if user and user.id != completed_by_id:
+                    notifications.append(dict(
                         user_id=user.id,
                         title='Tarefa concluída',
-                        message=f'A tarefa "{task.title}" foi concluída por {completed_by.display_name}',
+                        message=message,
                         notification_type=NotificationType.SUCCESS,
-                        action_url=f'/tasks/{task.id}',
+                        action_url=action_url,
                         action_text='Ver Tarefa',
                         entity_type='task',
-                        entity_id=task.id
-                    )
-                    db.session.add(notification)
+                        entity_id=task_id,
+                        created_at=now
+                    ))
             
             # Notificar criador da tarefa (se diferente)
             # Implementar conforme necessário
             
+            inserted = self._insert_notifications(notifications)
             db.session.commit()
+            self._bump_notification_counters(inserted)
             return True
             
         except Exception as e:
@@ -180,29 +287,7 @@ class NotificationService:
             if not user.email or not user.email_notifications:
                 return False
             
-            # Obter tarefas do dia
-            today = datetime.utcnow().date()
-            
-            # Tarefas vencendo hoje
-            due_today = Task.query.filter(
-                Task.assignments_json.like(f'%"userId": "{user.azure_id}"%'),
-                Task.status != TaskStatus.COMPLETED,
-                db.func.date(Task.due_date) == today
-            ).all()
-            
-            # Tarefas atrasadas
-            overdue_tasks = Task.query.filter(
-                Task.assignments_json.like(f'%"userId": "{user.azure_id}"%'),
-                Task.is_overdue == True,
-                Task.status != TaskStatus.COMPLETED
-            ).all()
-            
-            # Tarefas concluídas recentemente
-            recent_completed = Task.query.filter(
-                Task.assignments_json.like(f'%"userId": "{user.azure_id}"%'),
-                Task.status == TaskStatus.COMPLETED,
-                db.func.date(Task.completed_date) == today
-            ).all()
+            due_today, overdue_tasks, recent_completed = self._get_digest_tasks(user)
             
             if self.email_service:
                 return self.email_service.send_daily_digest(
@@ -218,23 +303,110 @@ class NotificationService:
             logger.error(f"Erro ao enviar resumo diário: {str(e)}")
             return False
     
+    def build_daily_digest(self, user: User, template=None):
+        """Monta a mensagem do resumo diário do usuário sem enviá-la"""
+        if not user.email or not user.email_notifications or not self.email_service:
+            return None
+        
+        due_today, overdue_tasks, recent_completed = self._get_digest_tasks(user)
+        return self.email_service.build_daily_digest(
+            user=user,
+            tasks_due=due_today,
+            tasks_overdue=overdue_tasks,
+            tasks_completed=recent_completed,
+            template=template
+        )
+    
+    def build_daily_digests(self, users: List[User], template=None) -> List:
+        """Monta os resumos diários de vários usuários com uma consulta de tarefas por lote"""
+        if not self.email_service:
+            return []
+        
+        recipients = [user for user in users if user.email and user.email_notifications]
+        tasks_by_user = self._get_digest_tasks_by_user([user.azure_id for user in recipients])
+        
+        messages = []
+        for user in recipients:
+            due_today, overdue_tasks, recent_completed = tasks_by_user.get(user.azure_id, ([], [], []))
+            try:
+                msg = self.email_service.build_daily_digest(
+                    user=user,
+                    tasks_due=due_today,
+                    tasks_overdue=overdue_tasks,
+                    tasks_completed=recent_completed,
+                    template=template
+                )
+                if msg is not None:
+                    messages.append(msg)
+            except Exception as e:
+                logger.error(f"Erro ao montar resumo diário para {user.email}: {str(e)}")
+        
+        return messages
+    
+    def _get_digest_tasks(self, user: User):
+        """Retorna as tarefas do resumo diário (vencendo hoje, atrasadas, concluídas hoje)"""
+        return self._get_digest_tasks_by_user([user.azure_id]).get(user.azure_id, ([], [], []))
+    
+    def _get_digest_tasks_by_user(self, azure_ids: List[str]) -> Dict[str, tuple]:
+        """Tarefas do resumo diário de vários usuários, agrupadas por azure_id"""
+        today = datetime.utcnow().date()
+        tasks_by_user = {}
+        
+        for start in range(0, len(azure_ids), DIGEST_USERS_BATCH):
+            batch = azure_ids[start:start + DIGEST_USERS_BATCH]
+            
+            # Uma consulta por lote pelo índice de task_assignments (em vez de LIKE sobre o JSON)
+            rows = db.session.query(task_assignments.c.user_azure_id, Task).join(
+                Task, task_assignments.c.task_id == Task.id
+            ).filter(
+                task_assignments.c.user_azure_id.in_(batch),
+                or_(
+                    # Tarefas vencendo hoje ou atrasadas
+                    and_(
+                        Task.status != TaskStatus.COMPLETED,
+                        or_(db.func.date(Task.due_date) == today, Task.is_overdue == True)
+                    ),
+                    # Tarefas concluídas recentemente
+                    and_(
+                        Task.status == TaskStatus.COMPLETED,
+                        db.func.date(Task.completed_date) == today
+                    )
+                )
+            ).all()
+            
+            for azure_id, task in rows:
+                due_today, overdue_tasks, recent_completed = tasks_by_user.setdefault(azure_id, ([], [], []))
+                if task.status == TaskStatus.COMPLETED:
+                    recent_completed.append(task)
+                    continue
+                if task.due_date and task.due_date.date() == today:
+                    due_today.append(task)
+                if task.is_overdue:
+                    overdue_tasks.append(task)
+        
+        return tasks_by_user
+    
     def send_system_notification(self, users: List[User], title: str, message: str, 
                                notification_type: NotificationType = NotificationType.INFO,
                                action_url: str = None):
         """Envia notificação do sistema para múltiplos usuários"""
         try:
-            for user in users:
-                notification = Notification(
+            now = datetime.utcnow()
+            inserted = self._insert_notifications([
+                dict(
                     user_id=user.id,
                     title=title,
                     message=message,
                     notification_type=notification_type,
                     action_url=action_url,
-                    entity_type='system'
+                    entity_type='system',
+                    created_at=now
                 )
-                db.session.add(notification)
+                for user in users
+            ])
             
             db.session.commit()
+            self._bump_notification_counters(inserted)
             return True
             
         except Exception as e:
@@ -244,18 +416,28 @@ class NotificationService:
     def mark_as_read(self, notification_id: int, user_id: int):
         """Marca uma notificação como lida"""
         try:
-            notification = Notification.query.filter_by(
-                id=notification_id,
-                user_id=user_id
-            ).first()
-            
-            if notification:
-                notification.is_read = True
-                notification.read_at = datetime.utcnow()
-                db.session.commit()
+            # UPDATE direto, sem carregar a notificação
+            now = datetime.utcnow()
+            rows = db.session.execute(
+                lambda_stmt(lambda: update(Notification).where(
+                    Notification.id == notification_id,
+                    Notification.user_id == user_id,
+                    Notification.is_read == False
+                ).values(is_read=True, read_at=now)),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            db.session.commit()
+            
+            if rows:
+                # UPDATE em massa não dispara eventos do ORM
+                bump_notification_counter(NOTIFICATION_UNREAD_KEY.format(user_id), -rows)
                 return True
             
-            return False
+            # Já estava lida (ou não existe / não pertence ao usuário)
+            return db.session.scalar(lambda_stmt(lambda: select(Notification.id).where(
+                Notification.id == notification_id,
+                Notification.user_id == user_id
+            ))) is not None
             
         except Exception as e:
             logger.error(f"Erro ao marcar notificação como lida: {str(e)}")
@@ -264,12 +446,19 @@ class NotificationService:
     def mark_all_as_read(self, user_id: int):
         """Marca todas as notificações do usuário como lidas"""
         try:
-            Notification.query.filter_by(
-                user_id=user_id,
-                is_read=False
-            ).update({'is_read': True, 'read_at': datetime.utcnow()})
+            now = datetime.utcnow()
+            db.session.execute(
+                lambda_stmt(lambda: update(Notification).where(
+                    Notification.user_id == user_id,
+                    Notification.is_read == False
+                ).values(is_read=True, read_at=now)),
+                execution_options={'synchronize_session': False}
+            )
             
             db.session.commit()
+            
+            # UPDATE em massa não dispara eventos do ORM
+            cache.delete(NOTIFICATION_UNREAD_KEY.format(user_id))
             return True
             
         except Exception as e:
@@ -278,18 +467,51 @@ class NotificationService:
     
     def get_unread_count(self, user_id: int) -> int:
         """Retorna contagem de notificações não lidas"""
-        return Notification.query.filter_by(
-            user_id=user_id,
-            is_read=False
-        ).count()
+        return self._get_cached_count(
+            NOTIFICATION_UNREAD_KEY.format(user_id),
+            lambda: db.session.scalar(lambda_stmt(lambda: select(func.count(Notification.id)).where(
+                Notification.user_id == user_id,
+                Notification.is_read == False
+            )))
+        )
+    
+    def get_total_count(self, user_id: int) -> int:
+        """Retorna contagem total de notificações"""
+        return self._get_cached_count(
+            NOTIFICATION_TOTAL_KEY.format(user_id),
+            lambda: db.session.scalar(lambda_stmt(lambda: select(func.count(Notification.id)).where(
+                Notification.user_id == user_id
+            )))
+        )
+    
+    def get_notifications_version(self, user_id: int) -> tuple:
+        """Versão das notificações do usuário lida do banco: quantidade, última criação e última leitura"""
+        return tuple(db.session.execute(lambda_stmt(lambda: select(
+            func.count(Notification.id),
+            func.max(Notification.created_at),
+            func.max(Notification.read_at)
+        ).where(Notification.user_id == user_id))).one())
+    
+    def _get_cached_count(self, key: str, count_query) -> int:
+        """Lê o contador do cache; em caso de ausência faz o COUNT e grava (NX)"""
+        # Cache por processo não vê as notificações criadas por outros workers/Celery: conta no banco
+        if not cache_is_shared():
+            return int(count_query())
+        
+        count = cache.get(key)
+        if count is None:
+            count = count_query()
+            cache.add(key, count, timeout=NOTIFICATION_COUNT_TIMEOUT)
+        return int(count)
     
     def get_recent_notifications(self, user_id: int, limit: int = 10) -> List[Notification]:
         """Retorna notificações recentes"""
-        return Notification.query.filter_by(
-            user_id=user_id
+        # lambda_stmt: o SQL fica em cache pelo código da lambda e só os parâmetros variam
+        return db.session.scalars(lambda_stmt(lambda: select(Notification).where(
+            Notification.user_id == user_id
         ).order_by(
             Notification.created_at.desc()
-        ).limit(limit).all()
+        ).limit(limit))).all()
     
     def cleanup_old_notifications(self, days: int = 30):
         """Remove notificações antigas"""
@@ -297,36 +519,128 @@ class NotificationService:
             cutoff_date = datetime.utcnow() - timedelta(days=days)
             
             # Arquivar notificações antigas lidas
-            Notification.query.filter(
-                Notification.created_at < cutoff_date,
-                Notification.is_read == True
-            ).update({'is_archived': True})
-            
-            db.session.commit()
+            self.archive_notifications(cutoff_date)
             return True
             
         except Exception as e:
             logger.error(f"Erro ao limpar notificações antigas: {str(e)}")
             return False
     
-    def _notify_managers_about_overdue_task(self, task: Task):
-        """Notifica gerentes sobre tarefas atrasadas"""
-        try:
-            # Buscar usuários com papel de gerente/admin
-            managers = User.query.filter(
+    def archive_notifications(self, cutoff_date: datetime) -> int:
+        """Arquiva notificações lidas anteriores a cutoff_date em lotes (transações curtas)"""
+        pending = select(Notification.id).where(
+            Notification.created_at < cutoff_date,
+            Notification.is_read == True,
+            Notification.is_archived == False
+        ).limit(NOTIFICATION_ARCHIVE_BATCH).scalar_subquery()
+        
+        archived = 0
+        while True:
+            result = db.session.execute(
+                update(Notification).where(Notification.id.in_(pending)).values(is_archived=True),
+                execution_options={'synchronize_session': False}
+            )
+            db.session.commit()
+            
+            if not result.rowcount:
+                return archived
+            archived += result.rowcount
+    
+    def _queue_task_emails(self, task_id: str, notification_type: str, emails: List[str]):
+        """Enfileira um job de email por destinatário, em paralelo nos workers (Celery group)"""
+        if not emails:
+            return
+        
+        group(
+            send_task_notification_task.s(task_id, notification_type, [email])
+            for email in emails
+        ).apply_async()
+    
+    def _insert_notifications(self, rows: List[Dict[str, Any]]) -> Counter:
+        """Insere as notificações em INSERTs multi-linha, em lotes, ignorando duplicadas; retorna as inseridas por usuário"""
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            stmt = pg_insert(Notification).on_conflict_do_nothing().returning(Notification.user_id)
+        elif dialect == 'sqlite':
+            stmt = sqlite_insert(Notification).on_conflict_do_nothing().returning(Notification.user_id)
+        else:
+            stmt = None
+        
+        inserted = Counter()
+        for start in range(0, len(rows), NOTIFICATION_INSERT_BATCH):
+            batch = rows[start:start + NOTIFICATION_INSERT_BATCH]
+            if stmt is None:
+                # Sem ON CONFLICT/RETURNING: INSERT simples, conta todas as linhas
+                db.session.execute(insert(Notification), batch)
+                inserted.update(row['user_id'] for row in batch)
+            else:
+                inserted.update(db.session.scalars(stmt, batch))
+        
+        return inserted
+    
+    def _bump_notification_counters(self, inserted: Counter):
+        """Ajusta os contadores das notificações inseridas; chamar só depois do commit"""
+        # INSERT em massa não dispara os eventos do ORM que mantêm os contadores
+        for user_id, count in inserted.items():
+            bump_notification_counter(NOTIFICATION_TOTAL_KEY.format(user_id), count)
+            bump_notification_counter(NOTIFICATION_UNREAD_KEY.format(user_id), count)
+    
+    def _get_users_by_azure_ids(self, azure_ids) -> Dict[str, NotificationRecipient]:
+        """Dados dos responsáveis indexados por azure_id: cache local e uma única consulta para os ausentes"""
+        users = {}
+        missing = []
+        with _recipient_cache_lock:
+            for azure_id in azure_ids:
+                user = _recipient_cache.get(azure_id)
+                if user is None:
+                    missing.append(azure_id)
+                else:
+                    users[azure_id] = user
+        
+        if missing:
+            rows = db.session.query(
+                User.id, User.azure_id, User.email, User.email_notifications
+            ).filter(User.azure_id.in_(missing)).all()
+            
+            with _recipient_cache_lock:
+                for row in rows:
+                    user = users[row.azure_id] = NotificationRecipient(*row)
+                    _recipient_cache[row.azure_id] = user
+        
+        return users
+    
+    def _get_managers(self) -> List[NotificationRecipient]:
+        """Usuários com papel de gerente/admin (cache local com TTL)"""
+        with _recipient_cache_lock:
+            managers = _managers_cache.get('managers')
+        if managers is not None:
+            return managers
+        
+        managers = [
+            NotificationRecipient(*row)
+            for row in db.session.query(
+                User.id, User.azure_id, User.email, User.email_notifications
+            ).filter(
                 or_(
                     User.is_admin == True,
                     User.department == 'Management'
                 )
             ).all()
+        ]
+        
+        with _recipient_cache_lock:
+            _managers_cache['managers'] = managers
+        return managers
+    
+    def _notify_managers_about_overdue_task(self, task: Task):
+        """Notifica gerentes sobre tarefas atrasadas"""
+        try:
+            managers = self._get_managers()
             
-            for manager in managers:
-                if manager.email_notifications and self.email_service:
-                    self.email_service.send_task_notification(
-                        task=task,
-                        notification_type='manager_overdue_alert',
-                        recipients=[manager.email]
-                    )
+            # Um único job e uma única mensagem SMTP para todos os gerentes, em cópia oculta
+            recipients = [manager.email for manager in managers if manager.email_notifications and manager.email]
+            if recipients:
+                send_task_notification_task.delay(task.id, 'manager_overdue_alert', recipients, bcc=True)
             
         except Exception as e:
             logger.error(f"Erro ao notificar gerentes: {str(e)}")
\ No newline at end of file
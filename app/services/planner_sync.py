@@ -1,15 +1,94 @@
+import json
 import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Optional
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
+from flask import current_app
 
-from app.models import db, Group, Planner, Task, Bucket, User, ActivityLog, TaskStatus, TaskPriority
+from app import cache, cache_inc
+from app.models import (
+    db, Group, Planner, Task, Bucket, User, ActivityLog, TaskStatus, TaskPriority, task_assignments,
+    ANALYTICS_VERSION_KEY
+)
 from app.services.microsoft_api import MicrosoftPlannerAPI
 
 logger = logging.getLogger(__name__)
 
+# Último @odata.etag sincronizado de cada tarefa (sem alterar o schema)
+TASK_ETAG_KEY = 'graph:etag:task:{}'
+ETAG_TIMEOUT = 7 * 24 * 3600
+TASK_INSERT_BATCH = 1000
+# Commit intermediário dentro de um grupo a cada N tarefas, para limitar o tamanho da transação
+SYNC_COMMIT_EVERY = 5000
+GROUPS_COMMIT_EVERY = 500
+
+# Dados do responsável usados para enriquecer os assignments
+AssigneeInfo = namedtuple('AssigneeInfo', 'display_name email')
+
+# Prioridade do Microsoft Planner (0=low ... 10=high), indexada, para nosso TaskPriority
+_PRIORITY_TABLE = (
+    (TaskPriority.LOW,) * 4 + (TaskPriority.MEDIUM,) * 3 + (TaskPriority.HIGH,) * 2 + (TaskPriority.URGENT,) * 2
+)
+
+@lru_cache(maxsize=4096)
+def _parse_dt(value: Optional[str]) -> Optional[datetime]:
+    """Converte data ISO 8601 do Graph (sufixo Z) em datetime com fuso; None se vazio"""
+    if not value:
+        return None
+    # fromisoformat só aceita 'Z' a partir do Python 3.11 (a imagem usa 3.10)
+    if value[-1] == 'Z':
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Coluna DateTime sem fuso devolve o instante UTC sem tzinfo: reanexa UTC para comparar"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def _set_if_changed(obj, attr: str, value) -> bool:
+    """Atribui só se o valor mudou (não marca a linha como alterada à toa); retorna se mudou"""
+    current = getattr(obj, attr)
+    if isinstance(value, datetime):
+        current = _as_utc(current)
+    if current == value:
+        return False
+    setattr(obj, attr, value)
+    return True
+
+def _to_json(value) -> str:
+    """JSON canônico (chaves ordenadas) para que payloads iguais gerem a mesma string"""
+    return json.dumps(value, sort_keys=True)
+
+def _extract_labels(task_data: Dict) -> Optional[List[str]]:
+    """Categorias aplicadas da tarefa (None se o Graph não enviou appliedCategories)"""
+    categories = task_data.get('appliedCategories')
+    return [category for category, applied in categories.items() if applied] if categories else None
+
+def _map_priority(ms_priority) -> TaskPriority:
+    """Converte a prioridade do Planner via tabela (valores fora de 0-10 são limitados)"""
+    return _PRIORITY_TABLE[min(max(ms_priority or 0, 0), 10)]
+
+def _derive_status(percent_complete: int, completed_date, due_date, now) -> tuple:
+    """Status e flag de atraso a partir do progresso, da conclusão e do vencimento"""
+    if completed_date or percent_complete == 100:
+        return TaskStatus.COMPLETED, False
+    if due_date and due_date < now:
+        return TaskStatus.OVERDUE, True
+    if percent_complete > 0:
+        return TaskStatus.IN_PROGRESS, False
+    return TaskStatus.NOT_STARTED, False
+
 class PlannerSync:
-    def __init__(self, api: MicrosoftPlannerAPI, user_id: int):
+    def __init__(self, api: MicrosoftPlannerAPI, user_id: int, user_cache: Dict = None,
+                 user_lock: threading.RLock = None):
         self.api = api
         self.user_id = user_id
         self.sync_stats = {
@@ -19,11 +98,21 @@ class PlannerSync:
             'errors': 0,
             'users_enriched': 0
         }
+        # Responsáveis já resolvidos nesta sincronização, por azure_id (None = não existe no Azure AD);
+        # compartilhados entre as threads de grupos para que cada usuário seja criado uma única vez
+        self._user_cache: Dict[str, Optional[AssigneeInfo]] = user_cache if user_cache is not None else {}
+        self._user_lock = user_lock or threading.RLock()
+        # Instante de referência da sincronização (last_sync e cálculo de atraso), lido uma única vez
+        self._now = datetime.now(timezone.utc)
+        # ETags das tarefas ainda não commitadas e quantas tarefas estão na transação aberta
+        self._pending_etags: Dict[str, str] = {}
+        self._uncommitted = 0
     
     def sync_all_data(self, force: bool = False) -> Dict:
         """Sincroniza todos os dados"""
         try:
             logger.info(f"Iniciando sincronização completa para usuário {self.user_id}")
+            self._now = datetime.now(timezone.utc)
             
             # Sincronizar grupos
             groups_result = self.sync_groups(force)
@@ -31,8 +120,8 @@ class PlannerSync:
                 return groups_result
             
             # Sincronizar planners de cada grupo
-            for group in Group.query.filter_by(is_active=True).all():
-                self.sync_group_planners(group.id, force)
+            group_ids = [group_id for (group_id,) in db.session.query(Group.id).filter_by(is_active=True)]
+            self._sync_groups_concurrently(group_ids, force)
             
             # Registrar atividade
             activity = ActivityLog(
@@ -58,59 +147,108 @@ class PlannerSync:
                 'stats': self.sync_stats
             }
     
+    def _sync_groups_concurrently(self, group_ids: List[str], force: bool = False):
+        """Sincroniza os planners dos grupos em paralelo, um contexto de aplicação (e sessão) por thread"""
+        workers = current_app.config.get('SYNC_WORKERS', 8)
+        
+        # SQLite serializa as escritas: threads só gerariam 'database is locked'
+        if db.session.get_bind().dialect.name == 'sqlite':
+            workers = 1
+        
+        if workers <= 1 or len(group_ids) <= 1:
+            for group_id in group_ids:
+                self.sync_group_planners(group_id, force)
+            return
+        
+        app = current_app._get_current_object()
+        with ThreadPoolExecutor(max_workers=min(workers, len(group_ids))) as pool:
+            futures = [
+                pool.submit(self._sync_group_in_context, app, group_id, force)
+                for group_id in group_ids
+            ]
+            for future in as_completed(futures):
+                try:
+                    stats = future.result()
+                except Exception as e:
+                    logger.error(f"Erro na thread de sincronização de grupo: {str(e)}")
+                    self.sync_stats['errors'] += 1
+                    continue
+                
+                for key, value in stats.items():
+                    self.sync_stats[key] += value
+    
+    def _sync_group_in_context(self, app, group_id: str, force: bool = False) -> Dict:
+        """Sincroniza um grupo em uma thread e retorna as estatísticas parciais"""
+        # Novo app context = nova sessão do Flask-SQLAlchemy, removida ao sair
+        with app.app_context():
+            sync = PlannerSync(self.api, self.user_id, user_cache=self._user_cache, user_lock=self._user_lock)
+            sync._now = self._now
+            sync.sync_group_planners(group_id, force)
+            return sync.sync_stats
+    
     def sync_groups(self, force: bool = False) -> Dict:
         """Sincroniza grupos do Azure AD"""
         try:
-            groups_data = self.api.get_groups(limit=100)
+            # Todas as páginas de grupos (@odata.nextLink), processadas conforme chegam
+            processed = 0
+            uncommitted = 0
+            for page in self.api.iter_group_pages(limit=100):
+                # Grupos existentes da página em uma única consulta
+                existing = self._load_by_ids(Group, [group_data['id'] for group_data in page])
+                processed += len(page)
+                uncommitted += len(page)
+                
+                for group_data in page:
+                    self._sync_group(group_data, existing.get(group_data['id']))
+                
+                if uncommitted >= GROUPS_COMMIT_EVERY:
+                    db.session.commit()
+                    uncommitted = 0
             
-            if not groups_data or 'value' not in groups_data:
+            if not processed:
                 return {'success': False, 'error': 'Nenhum grupo encontrado'}
             
-            for group_data in groups_data['value']:
-                try:
-                    group = Group.query.get(group_data['id'])
-                    
-                    if group:
-                        # Atualizar grupo existente
-                        group.name = group_data.get('displayName', group.name)
-                        group.email = group_data.get('mail', group.email)
-                        group.description = group_data.get('description', group.description)
-                        group.group_type = group_data.get('groupTypes', [None])[0] if group_data.get('groupTypes') else None
-                        group.visibility = group_data.get('visibility', group.visibility)
-                        
-                        if group_data.get('createdDateTime'):
-                            group.created_date = datetime.fromisoformat(
-                                group_data['createdDateTime'].replace('Z', '+00:00')
-                            )
-                    else:
-                        # Criar novo grupo
-                        group = Group(
-                            id=group_data['id'],
-                            name=group_data.get('displayName', ''),
-                            email=group_data.get('mail', ''),
-                            description=group_data.get('description', ''),
-                            group_type=group_data.get('groupTypes', [None])[0] if group_data.get('groupTypes') else None,
-                            visibility=group_data.get('visibility', ''),
-                            created_date=datetime.fromisoformat(
-                                group_data['createdDateTime'].replace('Z', '+00:00')
-                            ) if group_data.get('createdDateTime') else None
-                        )
-                        db.session.add(group)
-                    
-                    group.last_sync = datetime.now(timezone.utc)
-                    self.sync_stats['groups'] += 1
-                    
-                except Exception as e:
-                    logger.error(f"Erro ao sincronizar grupo {group_data.get('id')}: {str(e)}")
-                    self.sync_stats['errors'] += 1
-            
             db.session.commit()
             return {'success': True}
             
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Erro ao sincronizar grupos: {str(e)}")
             return {'success': False, 'error': str(e)}
     
+    def _sync_group(self, group_data: Dict, group: Group = None):
+        """Sincroniza um grupo (group: registro existente pré-carregado, ou None para criar)"""
+        try:
+            if group:
+                # Atualizar grupo existente
+                _set_if_changed(group, 'name', group_data.get('displayName', group.name))
+                _set_if_changed(group, 'email', group_data.get('mail', group.email))
+                _set_if_changed(group, 'description', group_data.get('description', group.description))
+                _set_if_changed(group, 'group_type', group_data.get('groupTypes', [None])[0] if group_data.get('groupTypes') else None)
+                _set_if_changed(group, 'visibility', group_data.get('visibility', group.visibility))
+                
+                if group_data.get('createdDateTime'):
+                    _set_if_changed(group, 'created_date', _parse_dt(group_data['createdDateTime']))
+            else:
+                # Criar novo grupo
+                group = Group(
+                    id=group_data['id'],
+                    name=group_data.get('displayName', ''),
+                    email=group_data.get('mail', ''),
+                    description=group_data.get('description', ''),
+                    group_type=group_data.get('groupTypes', [None])[0] if group_data.get('groupTypes') else None,
+                    visibility=group_data.get('visibility', ''),
+                    created_date=_parse_dt(group_data.get('createdDateTime'))
+                )
+                db.session.add(group)
+            
+            group.last_sync = self._now
+            self.sync_stats['groups'] += 1
+        
+        except Exception as e:
+            logger.error(f"Erro ao sincronizar grupo {group_data.get('id')}: {str(e)}")
+            self.sync_stats['errors'] += 1
+    
     def sync_group_planners(self, group_id: str, force: bool = False) -> Dict:
         """Sincroniza planners de um grupo"""
         try:
@@ -120,302 +258,437 @@ class PlannerSync:
                 logger.warning(f"Nenhum planner encontrado ou erro ao buscar planners do grupo {group_id}")
                 return {'success': True, 'planners': 0}
             
+            # Buckets e tarefas de todos os planners do grupo via $batch
+            plans_content = self.api.get_plans_content(
+                [planner_data['id'] for planner_data in planners_data['value']]
+            )
+            
+            existing = self._load_by_ids(Planner, [planner_data['id'] for planner_data in planners_data['value']])
+            
             for planner_data in planners_data['value']:
+                # Cada planner em um SAVEPOINT: uma falha desfaz só ele, não os anteriores do grupo
+                pending_etags = dict(self._pending_etags)
+                uncommitted = self._uncommitted
                 try:
-                    self._sync_planner(planner_data, group_id)
+                    with db.session.begin_nested():
+                        self._sync_planner(
+                            planner_data, group_id, plans_content.get(planner_data['id']),
+                            existing.get(planner_data['id'])
+                        )
                     self.sync_stats['planners'] += 1
                 except Exception as e:
+                    # O SAVEPOINT já foi desfeito; os ETags deste planner não foram persistidos
+                    self._pending_etags = pending_etags
+                    self._uncommitted = uncommitted
                     logger.error(f"Erro ao sincronizar planner {planner_data.get('id')}: {str(e)}")
                     self.sync_stats['errors'] += 1
+                
+                if self._uncommitted >= SYNC_COMMIT_EVERY:
+                    self._commit()
             
-            db.session.commit()
+            # Uma transação por grupo (não mais uma por planner)
+            self._commit()
             return {'success': True, 'planners': len(planners_data['value'])}
             
         except Exception as e:
+            self._rollback()
             logger.error(f"Erro ao sincronizar planners do grupo {group_id}: {str(e)}")
             # Não falhar toda a sincronização por causa de um grupo
             self.sync_stats['errors'] += 1
             return {'success': False, 'error': str(e), 'planners': 0}
     
-    def sync_planner_tasks(self, planner_id: str, force: bool = False) -> Dict:
+    def sync_planner_tasks(self, planner_id: str, force: bool = False, tasks_data: Dict = None) -> Dict:
         """Sincroniza tarefas de um planner"""
         try:
-            tasks_data = self.api.get_planner_tasks(planner_id)
-            
-            if not tasks_data or 'value' not in tasks_data:
-                return {'success': True, 'tasks': 0}
-            
-            for task_data in tasks_data['value']:
-                try:
-                    task = Task.query.get(task_data['id'])
-                    
-                    if task:
-                        self._update_task_from_data(task, task_data)
-                    else:
-                        task = self._create_task_from_data(task_data, planner_id)
-                        db.session.add(task)
+            # Tarefas processadas conforme as páginas chegam (primeira página pode vir do $batch)
+            synced = 0
+            tasks_synced = 0
+            synced_etags = {}
+            new_tasks = []
+            # Tarefas do planner em um SAVEPOINT: uma falha desfaz só elas
+            with db.session.begin_nested():
+                for page in self.api.iter_planner_task_pages(planner_id, first_page=tasks_data):
+                    # Responsáveis e tarefas existentes da página inteira em uma consulta cada
+                    self._prefetch_users(page)
+                    existing = self._load_by_ids(Task, [task_data['id'] for task_data in page])
                     
-                    # NOVO: Enriquecer informações dos responsáveis
-                    self._enrich_task_assignees(task, task_data)
-                    
-                    self.sync_stats['tasks'] += 1
-                    
-                except Exception as e:
-                    logger.error(f"Erro ao sincronizar tarefa {task_data.get('id')}: {str(e)}")
-                    self.sync_stats['errors'] += 1
+                    for task_data in page:
+                        synced += 1
+                        try:
+                            task = existing.get(task_data['id'])
+                            etag = task_data.get('@odata.etag')
+                            etag_key = TASK_ETAG_KEY.format(task_data['id'])
+                            
+                            # Tarefa inalterada no Graph desde a última sincronização: só o que depende do relógio
+                            if task and etag and not force and cache.get(etag_key) == etag:
+                                self._refresh_task_status(task)
+                                continue
+                            
+                            # NOVO: Enriquecer informações dos responsáveis
+                            assignments = self._enrich_task_assignees(task_data)
+                            
+                            if task:
+                                self._update_task_from_data(task, task_data, assignments)
+                            else:
+                                # Tarefas novas vão em INSERTs em massa, sem instanciar o modelo
+                                new_task = self._create_task_from_data(task_data, planner_id)
+                                if assignments:
+                                    new_task['assignments_json'] = _to_json(assignments)
+                                new_tasks.append(new_task)
+                            
+                            if etag:
+                                synced_etags[etag_key] = etag
+                            
+                            tasks_synced += 1
+                            
+                        except Exception as e:
+                            logger.error(f"Erro ao sincronizar tarefa {task_data.get('id')}: {str(e)}")
+                            self.sync_stats['errors'] += 1
+                
+                self._insert_tasks(new_tasks)
+                
+                # Atualizar métricas do planner (normalmente já no identity map; o SELECT faz autoflush)
+                planner = db.session.get(Planner, planner_id)
+                if planner:
+                    self._update_planner_metrics(planner)
             
-            # Atualizar métricas do planner
-            planner = Planner.query.get(planner_id)
-            if planner:
-                self._update_planner_metrics(planner)
+            # O commit fica com o grupo (sync_group_planners); os ETags esperam por ele
+            self.sync_stats['tasks'] += tasks_synced
+            self._pending_etags.update(synced_etags)
+            self._uncommitted += synced
             
-            db.session.commit()
-            return {'success': True, 'tasks': len(tasks_data['value'])}
+            return {'success': True, 'tasks': synced}
             
         except Exception as e:
+            # begin_nested já desfez o SAVEPOINT; nada deste planner entra nos ETags pendentes
             logger.error(f"Erro ao sincronizar tarefas do planner {planner_id}: {str(e)}")
             return {'success': False, 'error': str(e)}
     
-    def _sync_planner(self, planner_data: Dict, group_id: str):
-        """Sincroniza um planner específico"""
-        planner = Planner.query.get(planner_data['id'])
-        
+    def _sync_planner(self, planner_data: Dict, group_id: str, content: Dict = None, planner: Planner = None):
+        """Sincroniza um planner específico (planner: registro existente pré-carregado, ou None para criar)"""
         if planner:
             # Atualizar planner existente
-            planner.title = planner_data.get('title', planner.title)
+            _set_if_changed(planner, 'title', planner_data.get('title', planner.title))
             
             if planner_data.get('createdDateTime'):
-                planner.created_date = datetime.fromisoformat(
-                    planner_data['createdDateTime'].replace('Z', '+00:00')
-                )
+                _set_if_changed(planner, 'created_date', _parse_dt(planner_data['createdDateTime']))
         else:
             # Criar novo planner
             planner = Planner(
                 id=planner_data['id'],
                 group_id=group_id,
                 title=planner_data.get('title', ''),
-                created_date=datetime.fromisoformat(
-                    planner_data['createdDateTime'].replace('Z', '+00:00')
-                ) if planner_data.get('createdDateTime') else None
+                created_date=_parse_dt(planner_data.get('createdDateTime'))
             )
             db.session.add(planner)
         
-        planner.last_sync = datetime.now(timezone.utc)
+        planner.last_sync = self._now
+        
+        # Dados pré-carregados via $batch (None = buscar individualmente)
+        content = dict(content or {})
+        
+        # Sem o $batch, buckets e primeira página de tarefas são buscados em paralelo;
+        # a gravação continua em sequência na mesma sessão (tarefas referenciam buckets)
+        endpoints = {
+            key: f'/planner/plans/{planner.id}/{key}'
+            for key in ('buckets', 'tasks') if content.get(key) is None
+        }
+        if endpoints:
+            responses = self.api.fetch_concurrently(self.api.make_request, list(endpoints.values()), workers=2)
+            for key, endpoint in endpoints.items():
+                content[key] = responses.get(endpoint)
         
         # Sincronizar buckets do planner
-        self._sync_planner_buckets(planner.id)
+        self._sync_planner_buckets(planner.id, content.get('buckets'))
         
         # Sincronizar tarefas do planner
-        self.sync_planner_tasks(planner.id)
+        self.sync_planner_tasks(planner.id, tasks_data=content.get('tasks'))
     
-    def _sync_planner_buckets(self, planner_id: str):
+    def _sync_planner_buckets(self, planner_id: str, buckets_data: Dict = None):
         """Sincroniza buckets de um planner"""
         try:
-            buckets_data = self.api.get_buckets(planner_id)
+            if buckets_data is None:
+                buckets_data = self.api.get_buckets(planner_id)
             
             if not buckets_data or 'value' not in buckets_data:
                 return
             
+            existing = self._load_by_ids(Bucket, [bucket_data['id'] for bucket_data in buckets_data['value']])
+            
+            new_buckets = []
             for bucket_data in buckets_data['value']:
-                bucket = Bucket.query.get(bucket_data['id'])
+                bucket = existing.get(bucket_data['id'])
                 
                 if bucket:
-                    bucket.name = bucket_data.get('name', bucket.name)
-                    bucket.order_hint = bucket_data.get('orderHint', bucket.order_hint)
+                    _set_if_changed(bucket, 'name', bucket_data.get('name', bucket.name))
+                    _set_if_changed(bucket, 'order_hint', bucket_data.get('orderHint', bucket.order_hint))
                 else:
-                    bucket = Bucket(
+                    new_buckets.append(dict(
                         id=bucket_data['id'],
                         planner_id=planner_id,
                         name=bucket_data.get('name', ''),
                         order_hint=bucket_data.get('orderHint', '')
-                    )
-                    db.session.add(bucket)
+                    ))
+            
+            # Buckets novos em um único INSERT multi-linha (o autoflush grava antes o planner pendente)
+            if new_buckets:
+                self._upsert(Bucket, new_buckets, ('name', 'order_hint'))
         
         except Exception as e:
             logger.error(f"Erro ao sincronizar buckets do planner {planner_id}: {str(e)}")
     
-    def _update_task_from_data(self, task: Task, task_data: Dict):
-        """Atualiza tarefa existente com dados da API"""
+    def _refresh_task_status(self, task: Task) -> bool:
+        """Recalcula status e atraso de uma tarefa inalterada no Graph (o vencimento pode ter passado)"""
+        status, is_overdue = _derive_status(
+            task.percent_complete or 0, task.completed_date, _as_utc(task.due_date), self._now
+        )
+        changed = _set_if_changed(task, 'status', status)
+        return _set_if_changed(task, 'is_overdue', is_overdue) or changed
+    
+    def _update_task_from_data(self, task: Task, task_data: Dict, assignments: Dict = None) -> bool:
+        """Atualiza tarefa existente com dados da API (só as colunas que mudaram); retorna se algo mudou"""
+        changed = False
+        
         # Informações básicas
-        task.title = task_data.get('title', task.title)
+        changed |= _set_if_changed(task, 'title', task_data.get('title', task.title))
         
         # Datas
-        if task_data.get('startDateTime'):
-            task.start_date = datetime.fromisoformat(
-                task_data['startDateTime'].replace('Z', '+00:00')
-            )
+        start_date = _parse_dt(task_data.get('startDateTime'))
+        if start_date:
+            changed |= _set_if_changed(task, 'start_date', start_date)
         
-        if task_data.get('dueDateTime'):
-            task.due_date = datetime.fromisoformat(
-                task_data['dueDateTime'].replace('Z', '+00:00')
-            )
+        due_date = _parse_dt(task_data.get('dueDateTime'))
+        if due_date:
+            changed |= _set_if_changed(task, 'due_date', due_date)
+        else:
+            due_date = _as_utc(task.due_date)
         
         # Progresso
-        task.percent_complete = task_data.get('percentComplete', 0)
+        percent_complete = task_data.get('percentComplete', 0)
+        changed |= _set_if_changed(task, 'percent_complete', percent_complete)
         
         # Bucket
         if task_data.get('bucketId'):
-            task.bucket_id = task_data['bucketId']
+            changed |= _set_if_changed(task, 'bucket_id', task_data['bucketId'])
         
-        # Status baseado no completedDateTime e percentComplete
-        if task_data.get('completedDateTime'):
-            task.completed_date = datetime.fromisoformat(
-                task_data['completedDateTime'].replace('Z', '+00:00')
-            )
-            task.status = TaskStatus.COMPLETED
-        else:
-            task.completed_date = None
+        # Conclusão
+        completed_date = _parse_dt(task_data.get('completedDateTime'))
+        if completed_date or task.completed_date:
+            changed |= _set_if_changed(task, 'completed_date', completed_date)
         
-        # Determinar status baseado no percentComplete
-        if task.percent_complete == 100 and not task.completed_date:
-            task.status = TaskStatus.COMPLETED
-        elif task.percent_complete > 0:
-            task.status = TaskStatus.IN_PROGRESS
-        else:
-            task.status = TaskStatus.NOT_STARTED
+        # Status e atraso (mesma regra da criação)
+        status, is_overdue = _derive_status(percent_complete, completed_date, due_date, self._now)
+        changed |= _set_if_changed(task, 'status', status)
+        changed |= _set_if_changed(task, 'is_overdue', is_overdue)
         
-        # Verificar se está atrasada
-        if task.due_date and task.due_date < datetime.now(timezone.utc) and task.status != TaskStatus.COMPLETED:
-            task.is_overdue = True
-            # Se está atrasada e não está concluída, marcar como OVERDUE
-            if task.status != TaskStatus.COMPLETED:
-                task.status = TaskStatus.OVERDUE
-        else:
-            task.is_overdue = False
-        
-        # Assignments
-        if task_data.get('assignments'):
-            task.set_assignments(task_data['assignments'])
+        # Assignments (já enriquecidos, quando disponíveis)
+        assignments = assignments or task_data.get('assignments')
+        if assignments:
+            changed |= _set_if_changed(task, 'assignments_json', _to_json(assignments))
         
         # Labels (categorias aplicadas)
-        if task_data.get('appliedCategories'):
-            labels = []
-            for category, applied in task_data['appliedCategories'].items():
-                if applied:
-                    labels.append(category)
-            task.set_labels(labels)
+        labels = _extract_labels(task_data)
+        if labels is not None:
+            changed |= _set_if_changed(task, 'labels', _to_json(labels))
         
         # Priority do Microsoft Planner (0=low, 10=high) para nosso sistema (TaskPriority enum)
-        ms_priority = task_data.get('priority', 0)
-        if ms_priority >= 9:
-            task.priority = TaskPriority.URGENT
-        elif ms_priority >= 7:
-            task.priority = TaskPriority.HIGH
-        elif ms_priority >= 4:
-            task.priority = TaskPriority.MEDIUM
-        else:
-            task.priority = TaskPriority.LOW
+        changed |= _set_if_changed(task, 'priority', _map_priority(task_data.get('priority', 0)))
+        return changed
     
-    def _create_task_from_data(self, task_data: Dict, planner_id: str) -> Task:
-        """Cria nova tarefa a partir dos dados da API"""
-        # Determinar status inicial
-        initial_status = TaskStatus.NOT_STARTED
-        if task_data.get('completedDateTime'):
-            initial_status = TaskStatus.COMPLETED
-        elif task_data.get('percentComplete', 0) == 100:
-            initial_status = TaskStatus.COMPLETED
-        elif task_data.get('percentComplete', 0) > 0:
-            initial_status = TaskStatus.IN_PROGRESS
-        
-        # Determinar prioridade
-        ms_priority = task_data.get('priority', 0)
-        if ms_priority >= 9:
-            priority = TaskPriority.URGENT
-        elif ms_priority >= 7:
-            priority = TaskPriority.HIGH
-        elif ms_priority >= 4:
-            priority = TaskPriority.MEDIUM
-        else:
-            priority = TaskPriority.LOW
-        
-        task = Task(
+    def _create_task_from_data(self, task_data: Dict, planner_id: str) -> Dict:
+        """Monta as colunas de uma nova tarefa a partir dos dados da API (para INSERT em massa)"""
+        task = dict(
             id=task_data['id'],
             planner_id=planner_id,
             bucket_id=task_data.get('bucketId'),
             title=task_data.get('title', ''),
             percent_complete=task_data.get('percentComplete', 0),
-            status=initial_status,
-            priority=priority,
-            start_date=datetime.fromisoformat(
-                task_data['startDateTime'].replace('Z', '+00:00')
-            ) if task_data.get('startDateTime') else None,
-            due_date=datetime.fromisoformat(
-                task_data['dueDateTime'].replace('Z', '+00:00')
-            ) if task_data.get('dueDateTime') else None,
-            completed_date=datetime.fromisoformat(
-                task_data['completedDateTime'].replace('Z', '+00:00')
-            ) if task_data.get('completedDateTime') else None,
-            created_date=datetime.fromisoformat(
-                task_data['createdDateTime'].replace('Z', '+00:00')
-            ) if task_data.get('createdDateTime') else datetime.now(timezone.utc)
+            priority=_map_priority(task_data.get('priority', 0)),
+            start_date=_parse_dt(task_data.get('startDateTime')),
+            due_date=_parse_dt(task_data.get('dueDateTime')),
+            completed_date=_parse_dt(task_data.get('completedDateTime')),
+            created_date=_parse_dt(task_data.get('createdDateTime')) or self._now,
+            # Mesmas chaves em todas as linhas: o INSERT em massa agrupa as tarefas em um único lote
+            assignments_json=_to_json(task_data['assignments']) if task_data.get('assignments') else None,
+            labels=None
         )
         
-        # Assignments
-        if task_data.get('assignments'):
-            task.set_assignments(task_data['assignments'])
-        
         # Labels
-        if task_data.get('appliedCategories'):
-            labels = []
-            for category, applied in task_data['appliedCategories'].items():
-                if applied:
-                    labels.append(category)
-            task.set_labels(labels)
+        labels = _extract_labels(task_data)
+        if labels is not None:
+            task['labels'] = _to_json(labels)
         
-        # Verificar se está atrasada
-        if task.due_date and task.due_date < datetime.now(timezone.utc) and task.status != TaskStatus.COMPLETED:
-            task.is_overdue = True
-            task.status = TaskStatus.OVERDUE
+        # Status e atraso
+        task['status'], task['is_overdue'] = _derive_status(
+            task['percent_complete'], task['completed_date'], task['due_date'], self._now
+        )
         
         return task
     
-    def _enrich_task_assignees(self, task: Task, task_data: Dict):
+    def _insert_tasks(self, tasks: List[Dict]):
+        """Insere as tarefas novas em INSERTs multi-linha, em lotes (upsert se outra sincronização já as criou)"""
+        if not tasks:
+            return
+        
+        # created_date fica com quem criou a tarefa primeiro
+        update_columns = [column for column in tasks[0] if column not in ('id', 'created_date')]
+        for start in range(0, len(tasks), TASK_INSERT_BATCH):
+            self._upsert(Task, tasks[start:start + TASK_INSERT_BATCH], update_columns)
+        
+        # INSERT em massa não dispara os eventos do ORM: task_assignments e versão do analytics
+        db.session.execute(
+            task_assignments.delete().where(task_assignments.c.task_id.in_([task['id'] for task in tasks]))
+        )
+        assignment_rows = [
+            {'task_id': task['id'], 'user_azure_id': user_id}
+            for task in tasks if task['assignments_json']
+            for user_id in json.loads(task['assignments_json'])
+        ]
+        if assignment_rows:
+            db.session.execute(task_assignments.insert(), assignment_rows)
+        cache_inc(ANALYTICS_VERSION_KEY)
+    
+    def _commit(self):
+        """Commita a transação aberta e só então grava os ETags das tarefas persistidas"""
+        db.session.commit()
+        
+        # ETags só são gravados depois do commit, para não pular tarefas não persistidas
+        if self._pending_etags:
+            cache.set_many(self._pending_etags, timeout=ETAG_TIMEOUT)
+            self._pending_etags = {}
+        self._uncommitted = 0
+    
+    def _rollback(self):
+        """Desfaz a transação do grupo (a sessão volta a ser utilizável) e descarta os ETags não persistidos"""
+        db.session.rollback()
+        self._pending_etags = {}
+        self._uncommitted = 0
+    
+    @staticmethod
+    def _upsert(model, rows: List[Dict], update_columns=()):
+        """INSERT multi-linha com ON CONFLICT: atualiza update_columns pela chave primária ou ignora a linha"""
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            stmt = pg_insert(model)
+        elif dialect == 'sqlite':
+            stmt = sqlite_insert(model)
+        else:
+            db.session.execute(insert(model), rows)
+            return
+        
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[model.id],
+                set_={column: stmt.excluded[column] for column in update_columns}
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing()
+        db.session.execute(stmt, rows)
+    
+    @staticmethod
+    def _load_by_ids(model, ids: List[str]) -> Dict:
+        """Carrega em uma única consulta os registros existentes, indexados pela chave primária"""
+        if not ids:
+            return {}
+        return {obj.id: obj for obj in model.query.filter(model.id.in_(ids)).all()}
+    
+    def _prefetch_users(self, tasks: List[Dict]):
+        """Carrega em uma única consulta os responsáveis ainda não resolvidos das tarefas"""
+        # O lock (compartilhado entre as threads de grupos) evita criar o mesmo usuário duas vezes
+        with self._user_lock:
+            ids = {user_id for task_data in tasks for user_id in (task_data.get('assignments') or {})}
+            ids -= self._user_cache.keys()
+            if not ids:
+                return
+            
+            rows = db.session.query(
+                User.azure_id, User.display_name, User.email
+            ).filter(User.azure_id.in_(ids)).all()
+            for azure_id, display_name, email in rows:
+                self._user_cache[azure_id] = AssigneeInfo(display_name, email)
+            
+            # Ausentes do banco: detalhes no Azure AD em lotes de 20 via $batch
+            missing = [user_id for user_id in ids if user_id not in self._user_cache]
+            if not missing:
+                return
+            
+            new_users = []
+            for user_id, user_data in self.api.get_users_batch(missing).items():
+                if user_data:
+                    new_users.append(self._create_user_from_data(user_id, user_data))
+                else:
+                    # 404 (removido do Azure AD) ou erro: vale só para esta sincronização
+                    logger.info(f"Usuário {user_id} não encontrado no Azure AD, usando dados do assignment")
+                    self._user_cache[user_id] = None
+            
+            self._insert_users(new_users)
+    
+    def _insert_users(self, users: List[Dict]):
+        """Insere os usuários novos em um único INSERT multi-linha e os registra no cache"""
+        if not users:
+            return
+        
+        # Outra sincronização concorrente pode ter criado o usuário: ignora o conflito
+        self._upsert(User, users)
+        for user in users:
+            self._user_cache[user['azure_id']] = AssigneeInfo(user['display_name'], user['email'])
+            logger.info(f"Usuário {user['azure_id']} adicionado ao banco: {user['display_name']}")
+        self.sync_stats['users_enriched'] += len(users)
+    
+    def _create_user_from_data(self, user_id: str, user_data: Dict) -> Dict:
+        """Monta as colunas do usuário local (inativo até o primeiro login) com os dados do Azure AD"""
+        # Obter telefone com fallback seguro
+        phone = user_data.get('mobilePhone')
+        if not phone:
+            business_phones = user_data.get('businessPhones', [])
+            phone = business_phones[0] if business_phones else None
+        
+        return dict(
+            azure_id=user_id,
+            email=user_data.get('mail') or user_data.get('userPrincipalName'),
+            display_name=user_data.get('displayName', 'Usuário'),
+            job_title=user_data.get('jobTitle'),
+            department=user_data.get('department'),
+            phone=phone,
+            is_active=False  # Usuários sincronizados começam inativos até fazerem login
+        )
+    
+    def _enrich_task_assignees(self, task_data: Dict) -> Dict:
         """
         NOVO: Enriquece as informações dos responsáveis da tarefa
-        buscando dados completos dos usuários no Azure AD e salvando no banco local
+        buscando dados completos dos usuários no Azure AD e salvando no banco local;
+        retorna os assignments enriquecidos (vazio se não houver ou em caso de erro)
         """
         try:
             assignments = task_data.get('assignments', {})
             enriched_assignments = {}
             
             for user_id, assignment_info in assignments.items():
-                # Verificar se o usuário já existe no banco
-                user = User.query.filter_by(azure_id=user_id).first()
-                
-                if not user:
-                    # Buscar informações completas do usuário no Azure AD
+                # Usuário já resolvido (pré-carregado do banco/$batch ou buscado antes nesta sincronização)
+                if user_id in self._user_cache:
+                    user = self._user_cache[user_id]
+                else:
+                    user = None
+                    # Fora do pré-carregamento: buscar individualmente no Azure AD
                     try:
                         user_data = self.api.get_user_details(user_id)
                         
                         if user_data:
-                            # Obter telefone com fallback seguro
-                            phone = user_data.get('mobilePhone')
-                            if not phone:
-                                business_phones = user_data.get('businessPhones', [])
-                                phone = business_phones[0] if business_phones else None
-                            
-                            # Criar ou atualizar usuário no banco
-                            user = User(
-                                azure_id=user_id,
-                                email=user_data.get('mail') or user_data.get('userPrincipalName'),
-                                display_name=user_data.get('displayName', 'Usuário'),
-                                job_title=user_data.get('jobTitle'),
-                                department=user_data.get('department'),
-                                phone=phone,
-                                is_active=False  # Usuários sincronizados começam inativos até fazerem login
-                            )
-                            db.session.add(user)
-                            self.sync_stats['users_enriched'] += 1
-                            logger.info(f"Usuário {user_id} adicionado ao banco: {user.display_name}")
+                            self._insert_users([self._create_user_from_data(user_id, user_data)])
+                            user = self._user_cache[user_id]
                         else:
                             # NOVO: Usuário não encontrado (404), usar dados do assignment
                             logger.warning(f"Usuário {user_id} não encontrado no Azure AD, usando dados do assignment")
+                        
+                        # Não repetir a busca nas próximas tarefas do mesmo responsável
+                        self._user_cache[user_id] = user
                     
                     except Exception as e:
                         # NOVO: Se for 404, é esperado - usuário foi removido do Azure AD
                         error_msg = str(e)
                         if "404" in error_msg or "Not Found" in error_msg:
                             logger.info(f"Usuário {user_id} não existe mais no Azure AD (removido ou inativado)")
+                            self._user_cache[user_id] = None
                         else:
                             logger.warning(f"Não foi possível buscar detalhes do usuário {user_id}: {error_msg}")
                 
@@ -427,24 +700,36 @@ class PlannerSync:
                     'userEmail': user.email if user else ''
                 }
             
-            # Atualizar assignments da tarefa com informações enriquecidas
-            if enriched_assignments:
-                task.set_assignments(enriched_assignments)
+            return enriched_assignments
         
         except Exception as e:
-            logger.error(f"Erro ao enriquecer responsáveis da tarefa {task.id}: {str(e)}")
+            logger.error(f"Erro ao enriquecer responsáveis da tarefa {task_data.get('id')}: {str(e)}")
+            return {}
     
     def _update_planner_metrics(self, planner: Planner):
         """Atualiza métricas calculadas do planner"""
         try:
-            tasks = Task.query.filter_by(planner_id=planner.id).all()
+            def count_if(condition):
+                return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
             
-            planner.total_tasks = len(tasks)
-            planner.completed_tasks = sum(1 for t in tasks if t.status == TaskStatus.COMPLETED)
-            planner.in_progress_tasks = sum(1 for t in tasks if t.status == TaskStatus.IN_PROGRESS)
-            planner.not_started_tasks = sum(1 for t in tasks if t.status == TaskStatus.NOT_STARTED)
-            planner.overdue_tasks = sum(1 for t in tasks if t.is_overdue)
-            planner.blocked_tasks = sum(1 for t in tasks if t.is_blocked)
+            # Todos os contadores em um único SELECT agregado, sem hidratar as tarefas
+            (
+                planner.total_tasks,
+                planner.completed_tasks,
+                planner.in_progress_tasks,
+                planner.not_started_tasks,
+                planner.overdue_tasks,
+                planner.blocked_tasks
+            ) = db.session.execute(
+                select(
+                    func.count(Task.id),
+                    count_if(Task.status == TaskStatus.COMPLETED),
+                    count_if(Task.status == TaskStatus.IN_PROGRESS),
+                    count_if(Task.status == TaskStatus.NOT_STARTED),
+                    count_if(Task.is_overdue == True),
+                    count_if(Task.is_blocked == True)
+                ).where(Task.planner_id == planner.id)
+            ).one()
             
         except Exception as e:
             logger.error(f"Erro ao atualizar métricas do planner {planner.id}: {str(e)}")
\ No newline at end of file
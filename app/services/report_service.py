@@ -167,10 +167,11 @@ class ReportService:
             logger.error(f"Erro ao gerar relatório customizado: {str(e)}")
             raise
     
-    def export_to_excel(self, report_data, filename):
-        """Exporta relatório para Excel"""
+    def export_to_excel(self, report_data, filename, output=None):
+        """Exporta relatório para Excel (no arquivo informado ou em memória)"""
         try:
-            output = BytesIO()
+            # openpyxl precisa de seek, então o destino deve ser um arquivo posicionável
+            output = output if output is not None else BytesIO()
             
             with pd.ExcelWriter(output, engine='openpyxl') as writer:
                 # Adicionar múltiplas abas se necessário
@@ -198,6 +199,34 @@ class ReportService:
             logger.error(f"Erro ao exportar para Excel: {str(e)}")
             raise
     
+    TASK_EXPORT_HEADER = [
+        'ID', 'Título', 'Status', 'Prioridade', 'Progresso', 'Data Início',
+        'Data Vencimento', 'Data Conclusão', 'Planner'
+    ]
+    
+    def iter_task_rows(self, filters, chunk_size=1000):
+        """Itera as linhas de exportação de tarefas sem carregar tudo em memória"""
+        query = db.session.query(
+            Task.id, Task.title, Task.status, Task.priority, Task.percent_complete,
+            Task.start_date, Task.due_date, Task.completed_date, Planner.title
+        ).join(Planner, Planner.id == Task.planner_id)
+        query = self._apply_filters(query, filters)
+        
+        for row in query.execution_options(stream_results=True).yield_per(chunk_size):
+            (task_id, title, status, priority, percent_complete,
+             start_date, due_date, completed_date, planner_title) = row
+            yield [
+                task_id[:8],
+                title,
+                status.value if status else '',
+                priority.value if priority else 0,
+                f"{percent_complete}%",
+                start_date.strftime('%d/%m/%Y') if start_date else '',
+                due_date.strftime('%d/%m/%Y') if due_date else '',
+                completed_date.strftime('%d/%m/%Y') if completed_date else '',
+                planner_title or ''
+            ]
+    
     def export_to_pdf(self, report_data, filename):
         """Exporta relatório para PDF"""
         # Implementação usando ReportLab ou WeasyPrint
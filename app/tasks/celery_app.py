@@ -12,6 +12,19 @@ def make_celery(app=None):
     )
     celery.conf.update(app.config)
     
+    # Relatórios longos vão para uma fila própria, sem bloquear tarefas curtas
+    celery.conf.update(
+        task_routes={
+            'app.tasks.report_tasks.run_report_task': {'queue': 'analytics'},
+            'app.tasks.report_tasks.process_scheduled_reports': {'queue': 'analytics'},
+            # Envio de emails (I/O de SMTP) em worker próprio com pool gevent
+            'app.tasks.email_tasks.*': {'queue': 'email'},
+            # Email de teste no worker que tem a configuração MAIL_*
+            'app.tasks.system_tasks.send_test_email': {'queue': 'email'},
+        },
+        task_default_queue='celery'
+    )
+    
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
             with app.app_context():
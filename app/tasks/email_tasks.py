@@ -0,0 +1,38 @@
+from celery import shared_task
+import logging
+
+from app.models import Task
+from app.services.email_service import get_email_service
+
+logger = logging.getLogger(__name__)
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def send_email_task(self, to_emails, subject, body_html, body_text=None, attachments=None, cc=None, bcc=None):
+    """Envia um email pelo SMTP no worker, com retry em falhas"""
+    try:
+        return get_email_service().deliver_email(
+            to_emails, subject, body_html, body_text, attachments, cc, bcc,
+            raise_errors=True
+        )
+        
+    except Exception as e:
+        logger.warning(f"Falha ao enviar email, tentativa {self.request.retries + 1}: {str(e)}")
+        raise self.retry(exc=e)
+
+
+@shared_task(acks_late=True)
+def send_task_notification_task(task_id, notification_type, recipients, bcc=False):
+    """Renderiza e envia o email de notificação de uma tarefa fora da requisição"""
+    task = Task.query.get(task_id)
+    if not task:
+        logger.warning(f"Tarefa {task_id} não encontrada para notificação por email")
+        return False
+    
+    # Já estamos no worker: envia direto, sem enfileirar outro job
+    return get_email_service().send_task_notification(
+        task=task,
+        notification_type=notification_type,
+        recipients=recipients,
+        background=False,
+        bcc=bcc
+    )
@@ -2,10 +2,12 @@ from celery import shared_task
 import logging
 from datetime import datetime, timedelta
 
+from sqlalchemy.orm import load_only
+
 from app import db
 from app.models import User, Task, TaskStatus
-from app.services.notification_service import NotificationService
-from app.services.email_service import EmailService
+from app.services.notification_service import NotificationService, get_notification_service
+from app.services.email_service import get_email_service
 
 logger = logging.getLogger(__name__)
 
@@ -69,21 +71,25 @@ def check_upcoming_due_dates():
 def send_daily_digests():
     """Envia resumos diários para todos os usuários"""
     try:
-        users = User.query.filter_by(
+        # Só as colunas usadas no resumo (demais carregadas sob demanda se o template pedir)
+        users = User.query.options(
+            load_only(User.id, User.azure_id, User.email, User.email_notifications, User.display_name)
+        ).filter_by(
             is_active=True,
             email_notifications=True
         ).all()
         
-        email_service = EmailService()
-        notification_service = NotificationService()
+        email_service = get_email_service()
+        notification_service = get_notification_service()
+        template = email_service.get_template("daily_digest")
+        if not template:
+            logger.warning("Template daily_digest não encontrado")
+            return 0
         
-        sent = 0
-        for user in users:
-            try:
-                if notification_service.send_daily_digest(user):
-                    sent += 1
-            except Exception as e:
-                logger.error(f"Erro ao enviar resumo diário para {user.email}: {str(e)}")
+        # Tarefas de todos os usuários em lote; mensagens renderizadas antes de abrir a conexão SMTP
+        messages = notification_service.build_daily_digests(users, template=template)
+        
+        sent = email_service.send_bulk(messages)
         
         logger.info(f"Resumos diários enviados: {sent}/{len(users)}")
         return sent
@@ -100,11 +106,8 @@ def cleanup_old_notifications(days: int = 30):
         
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        # Arquivar notificações antigas lidas
-        archived = Notification.query.filter(
-            Notification.created_at < cutoff_date,
-            Notification.is_read == True
-        ).update({'is_archived': True})
+        # Arquivar notificações antigas lidas (UPDATE em lotes)
+        archived = NotificationService().archive_notifications(cutoff_date)
         
         # Excluir notificações arquivadas muito antigas
         old_cutoff = datetime.utcnow() - timedelta(days=days * 2)
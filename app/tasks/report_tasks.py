@@ -10,7 +10,7 @@ from app.services.email_service import EmailService
 
 logger = logging.getLogger(__name__)
 
-@shared_task
+@shared_task(acks_late=True)
 def run_report_task(report_id: int, run_id: int, user_id: int):
     """Executa um relatório em background"""
     try:
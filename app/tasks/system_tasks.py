@@ -0,0 +1,38 @@
+from celery import shared_task
+from flask import current_app
+import logging
+import os
+
+from app.services.email_service import get_email_service
+from app.utils.backup import BackupManager
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def send_test_email(email: str):
+    """Envia email de teste em background (falha no envio marca o job como FAILURE)"""
+    email_service = get_email_service()
+    
+    sent = email_service.deliver_email(
+        to_emails=[email],
+        subject='Teste de Email - Planner Dashboard',
+        body_html='<h2>Teste de Email</h2><p>Este é um email de teste enviado pelo Planner Dashboard.</p>',
+        body_text='Teste de Email - Este é um email de teste enviado pelo Planner Dashboard.',
+        raise_errors=True
+    )
+    
+    if not sent:
+        raise RuntimeError('Configuração de email não definida')
+    
+    return True
+
+@shared_task
+def create_database_backup():
+    """Cria backup do banco de dados em background"""
+    backup_manager = BackupManager(current_app)
+    backup_file = backup_manager.create_database_backup()
+    
+    if not backup_file:
+        raise RuntimeError('Falha ao criar backup')
+    
+    return os.path.basename(backup_file)
@@ -27,7 +27,9 @@ class BackupManager:
         """Cria backup do banco de dados"""
         try:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_filename = f"backup_{timestamp}.sql"
+            # PostgreSQL usa o formato custom do pg_dump (.backup), restaurável em paralelo
+            extension = 'backup' if self.database_url.startswith('postgresql') else 'sql'
+            backup_filename = f"backup_{timestamp}.{extension}"
             backup_path = os.path.join(self.backup_folder, 'database', backup_filename)
             
             if self.database_url.startswith('postgresql'):
@@ -43,6 +45,8 @@ class BackupManager:
                     '-p', str(parsed.port or 5432),
                     '-U', parsed.username or 'postgres',
                     '-d', db_name,
+                    '-Fc',
+                    '-Z', str(self.app.config.get('BACKUP_COMPRESSION_LEVEL', 6)),
                     '-f', backup_path
                 ]
                 
@@ -101,14 +105,27 @@ class BackupManager:
                     '-c', f'CREATE DATABASE {db_name};'
                 ]
                 
-                restore_command = [
-                    'psql',
-                    '-h', parsed.hostname or 'localhost',
-                    '-p', str(parsed.port or 5432),
-                    '-U', parsed.username or 'postgres',
-                    '-d', db_name,
-                    '-f', backup_path
-                ]
+                if backup_filename.endswith('.backup'):
+                    # Formato custom: pg_restore com jobs paralelos
+                    restore_command = [
+                        'pg_restore',
+                        '-h', parsed.hostname or 'localhost',
+                        '-p', str(parsed.port or 5432),
+                        '-U', parsed.username or 'postgres',
+                        '-d', db_name,
+                        '-j', str(self.app.config.get('BACKUP_RESTORE_JOBS', os.cpu_count() or 1)),
+                        backup_path
+                    ]
+                else:
+                    # Backups antigos em SQL puro
+                    restore_command = [
+                        'psql',
+                        '-h', parsed.hostname or 'localhost',
+                        '-p', str(parsed.port or 5432),
+                        '-U', parsed.username or 'postgres',
+                        '-d', db_name,
+                        '-f', backup_path
+                    ]
                 
                 # Configurar variável de ambiente para senha
                 env = os.environ.copy()
@@ -0,0 +1,22 @@
+# app/utils/database.py
+from contextlib import contextmanager
+from flask import current_app
+from sqlalchemy.orm import Session
+
+from app import db
+
+@contextmanager
+def read_session():
+    """Sessão para consultas somente leitura na réplica.
+    
+    Sem SQLALCHEMY_BINDS['replica'] configurado, usa a sessão principal.
+    """
+    if 'replica' not in (current_app.config.get('SQLALCHEMY_BINDS') or {}):
+        yield db.session
+        return
+    
+    session = Session(bind=db.engines['replica'], expire_on_commit=False)
+    try:
+        yield session
+    finally:
+        session.close()
@@ -2,114 +2,142 @@
 from flask import request, session
 from sqlalchemy import and_, or_, func
 from datetime import datetime, timedelta
+from functools import lru_cache
 import json
 from app.models import Task, Planner, TaskStatus, TaskPriority
 
+def _filter_status(query, value):
+    """Filtro por status"""
+    return query.filter(Task.status.in_(value.split(',')))
+
+def _filter_priority(query, value):
+    """Filtro por prioridade"""
+    try:
+        priority_list = [int(p) for p in value.split(',')]
+        return query.filter(Task.priority.in_(priority_list))
+    except ValueError:
+        return query
+
+def _filter_planner(query, value):
+    """Filtro por planner"""
+    return query.filter(Task.planner_id == value)
+
+def _filter_group(query, value):
+    """Filtro por grupo"""
+    # CORREÇÃO AQUI: evitar JOIN duplicado
+    # Primeiro verificar se já tem join com Planner
+    # Se não tiver, fazer o join
+    query = query.join(Planner, Planner.id == Task.planner_id)
+    return query.filter(Planner.group_id == value)
+
+def _filter_assigned_to(query, value):
+    """Filtro por responsável"""
+    if value == 'me':
+        # Filtrar tarefas atribuídas ao usuário atual
+        # Implementar conforme necessário
+        return query
+    elif value == 'unassigned':
+        return query.filter(Task.assignments_json == '{}')
+    return query.filter(Task.assignments_json.like(f'%"userId": "{value}"%'))
+
+def _filter_date_range(query, value):
+    """Filtro por datas"""
+    now = datetime.utcnow().date()
+    
+    if value == 'today':
+        query = query.filter(func.date(Task.due_date) == now)
+    elif value == 'this_week':
+        start_week = now - timedelta(days=now.weekday())
+        end_week = start_week + timedelta(days=6)
+        query = query.filter(func.date(Task.due_date).between(start_week, end_week))
+    elif value == 'overdue':
+        query = query.filter(Task.is_overdue == True)
+    elif value == 'next_7_days':
+        end_date = now + timedelta(days=7)
+        query = query.filter(func.date(Task.due_date) <= end_date)
+    return query
+
+def _filter_progress(query, value):
+    """Filtro por progresso"""
+    if value == 'not_started':
+        query = query.filter(Task.percent_complete == 0)
+    elif value == 'in_progress':
+        query = query.filter(Task.percent_complete > 0, Task.percent_complete < 100)
+    elif value == 'completed':
+        query = query.filter(Task.percent_complete == 100)
+    return query
+
+def _filter_labels(query, value):
+    """Filtro por labels/tags"""
+    for label in value.split(','):
+        query = query.filter(Task.labels.like(f'%"{label}"%'))
+    return query
+
+def _filter_category(query, value):
+    """Filtro por categoria"""
+    return query.filter(Task.category == value)
+
+def _filter_effort(query, value):
+    """Filtro por esforço"""
+    try:
+        return query.filter(Task.effort == int(value))
+    except ValueError:
+        return query
+
+def _filter_business_value(query, value):
+    """Filtro por valor de negócio"""
+    try:
+        return query.filter(Task.business_value == int(value))
+    except ValueError:
+        return query
+
+def _filter_search(query, value):
+    """Filtro de texto"""
+    search_term = f"%{value}%"
+    return query.filter(
+        or_(
+            Task.title.ilike(search_term),
+            Task.description.ilike(search_term),
+            Task.blocked_reason.ilike(search_term)
+        )
+    )
+
+# Ordem de aplicação dos filtros (o JOIN de grupo depende dela)
+FILTER_HANDLERS = (
+    ('status', _filter_status),
+    ('priority', _filter_priority),
+    ('planner_id', _filter_planner),
+    ('group_id', _filter_group),
+    ('assigned_to', _filter_assigned_to),
+    ('date_range', _filter_date_range),
+    ('progress', _filter_progress),
+    ('labels', _filter_labels),
+    ('category', _filter_category),
+    ('effort', _filter_effort),
+    ('business_value', _filter_business_value),
+    ('search', _filter_search),
+)
+FILTER_KEYS = frozenset(key for key, _ in FILTER_HANDLERS)
+
+@lru_cache(maxsize=256)
+def build_filter(param_keys):
+    """Monta (uma vez por combinação de parâmetros) a sequência de filtros a aplicar"""
+    return tuple(
+        (key, handler) for key, handler in FILTER_HANDLERS if key in param_keys
+    )
+
 class TaskFilter:
     """Sistema avançado de filtros para tarefas"""
     
     @staticmethod
     def apply_filters(query, filter_params):
         """Aplica múltiplos filtros à query"""
+        param_keys = frozenset(
+            key for key, value in filter_params.items() if value and key in FILTER_KEYS
+        )
         
-        # Filtro por status
-        if filter_params.get('status'):
-            status_list = filter_params['status'].split(',')
-            query = query.filter(Task.status.in_(status_list))
-        
-        # Filtro por prioridade
-        if filter_params.get('priority'):
-            try:
-                priority_list = [int(p) for p in filter_params['priority'].split(',')]
-                query = query.filter(Task.priority.in_(priority_list))
-            except ValueError:
-                pass
-        
-        # Filtro por planner
-        if filter_params.get('planner_id'):
-            query = query.filter(Task.planner_id == filter_params['planner_id'])
-        
-        # Filtro por grupo - CORREÇÃO AQUI: evitar JOIN duplicado
-        if filter_params.get('group_id'):
-            # Primeiro verificar se já tem join com Planner
-            # Se não tiver, fazer o join
-            query = query.join(Planner, Planner.id == Task.planner_id)
-            query = query.filter(Planner.group_id == filter_params['group_id'])
-        
-        # Filtro por responsável
-        if filter_params.get('assigned_to'):
-            if filter_params['assigned_to'] == 'me':
-                # Filtrar tarefas atribuídas ao usuário atual
-                # Implementar conforme necessário
-                pass
-            elif filter_params['assigned_to'] == 'unassigned':
-                query = query.filter(Task.assignments_json == '{}')
-            else:
-                query = query.filter(Task.assignments_json.like(f'%"userId": "{filter_params["assigned_to"]}"%'))
-        
-        # Filtro por datas
-        if filter_params.get('date_range'):
-            date_range = filter_params['date_range']
-            now = datetime.utcnow().date()
-            
-            if date_range == 'today':
-                query = query.filter(func.date(Task.due_date) == now)
-            elif date_range == 'this_week':
-                start_week = now - timedelta(days=now.weekday())
-                end_week = start_week + timedelta(days=6)
-                query = query.filter(func.date(Task.due_date).between(start_week, end_week))
-            elif date_range == 'overdue':
-                query = query.filter(Task.is_overdue == True)
-            elif date_range == 'next_7_days':
-                end_date = now + timedelta(days=7)
-                query = query.filter(func.date(Task.due_date) <= end_date)
-        
-        # Filtro por progresso
-        if filter_params.get('progress'):
-            progress = filter_params['progress']
-            if progress == 'not_started':
-                query = query.filter(Task.percent_complete == 0)
-            elif progress == 'in_progress':
-                query = query.filter(Task.percent_complete > 0, Task.percent_complete < 100)
-            elif progress == 'completed':
-                query = query.filter(Task.percent_complete == 100)
-        
-        # Filtro por labels/tags
-        if filter_params.get('labels'):
-            labels = filter_params['labels'].split(',')
-            for label in labels:
-                query = query.filter(Task.labels.like(f'%"{label}"%'))
-        
-        # Filtro por categoria
-        if filter_params.get('category'):
-            query = query.filter(Task.category == filter_params['category'])
-        
-        # Filtro por esforço
-        if filter_params.get('effort'):
-            try:
-                effort = int(filter_params['effort'])
-                query = query.filter(Task.effort == effort)
-            except ValueError:
-                pass
-        
-        # Filtro por valor de negócio
-        if filter_params.get('business_value'):
-            try:
-                value = int(filter_params['business_value'])
-                query = query.filter(Task.business_value == value)
-            except ValueError:
-                pass
-        
-        # Filtro de texto
-        if filter_params.get('search'):
-            search_term = f"%{filter_params['search']}%"
-            query = query.filter(
-                or_(
-                    Task.title.ilike(search_term),
-                    Task.description.ilike(search_term),
-                    Task.blocked_reason.ilike(search_term)
-                )
-            )
+        for key, handler in build_filter(param_keys):
+            query = handler(query, filter_params[key])
         
         # Ordenação padrão
         query = query.order_by(Task.due_date.asc())
@@ -15,14 +15,21 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # Se usar PostgreSQL, configure estas opções
+    # (pool_size + max_overflow) x workers do gunicorn deve caber em max_connections
     if SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
         SQLALCHEMY_ENGINE_OPTIONS = {
-            'pool_size': int(os.environ.get('DATABASE_POOL_SIZE', 10)),
+            'pool_size': int(os.environ.get('DATABASE_POOL_SIZE', 20)),
             'max_overflow': int(os.environ.get('DATABASE_MAX_OVERFLOW', 20)),
-            'pool_recycle': int(os.environ.get('DATABASE_POOL_RECYCLE', 3600)),
+            'pool_recycle': int(os.environ.get('DATABASE_POOL_RECYCLE', 1800)),
+            'pool_timeout': int(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
             'pool_pre_ping': True
         }
     
+    # Réplica de leitura (opcional) para rotas somente leitura
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    if DATABASE_REPLICA_URL:
+        SQLALCHEMY_BINDS = {'replica': DATABASE_REPLICA_URL}
+    
     # Microsoft Graph API
     MS_GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
     
@@ -57,13 +64,25 @@ class Config:
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@planner-dashboard.com')
     
     # Cache
-    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'SimpleCache')
+    # Contadores, versões e travas precisam ser vistos por todos os workers (gunicorn e Celery):
+    # com REDIS_URL o cache é compartilhado; SimpleCache só serve para um processo único (desenvolvimento)
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'RedisCache' if os.environ.get('REDIS_URL') else 'SimpleCache')
     CACHE_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     CACHE_DEFAULT_TIMEOUT = 300
     
+    # Templates - bytecode compilado do Jinja persistido entre reinícios de workers
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR', '/tmp/jinja_cache')
+    
+    # Backups (pg_dump -Fc; use 0 para desligar a compressão em discos rápidos)
+    BACKUP_FOLDER = os.environ.get('BACKUP_FOLDER', 'backups')
+    BACKUP_COMPRESSION_LEVEL = int(os.environ.get('BACKUP_COMPRESSION_LEVEL', 6))
+    BACKUP_RESTORE_JOBS = int(os.environ.get('BACKUP_RESTORE_JOBS', os.cpu_count() or 1))
+    
     # Limites
     MAX_GROUPS_TO_PROCESS = int(os.environ.get('MAX_GROUPS_TO_PROCESS', 100))
     MAX_TASKS_PER_PLANNER = int(os.environ.get('MAX_TASKS_PER_PLANNER', 1000))
+    # Grupos sincronizados em paralelo (cada um dominado pela latência do Graph); SQLite sempre usa 1
+    SYNC_WORKERS = int(os.environ.get('SYNC_WORKERS', 8))
     
     # Features
     ENABLE_CREATE_TASKS = os.environ.get('ENABLE_CREATE_TASKS', 'True').lower() == 'true'
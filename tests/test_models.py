@@ -0,0 +1,38 @@
+from app import db, cache
+from app.models import Task, Planner, ANALYTICS_VERSION_KEY
+
+
+def test_task_commit_bumps_analytics_version(app):
+    """Commit de uma tarefa passa pelo after_flush e incrementa a versão de analytics"""
+    version = cache.get(ANALYTICS_VERSION_KEY) or 0
+    
+    db.session.add(Planner(id='plan-1', title='Planner'))
+    db.session.add(Task(id='task-1', planner_id='plan-1', title='Tarefa'))
+    db.session.commit()
+    
+    assert (cache.get(ANALYTICS_VERSION_KEY) or 0) > version
+
+
+def test_task_bulk_update_bumps_analytics_version(app):
+    """UPDATE em massa de tarefas também invalida o cache de analytics"""
+    db.session.add(Task(id='task-1', title='Tarefa'))
+    db.session.commit()
+    version = cache.get(ANALYTICS_VERSION_KEY) or 0
+    
+    Task.query.filter_by(id='task-1').update({'percent_complete': 50})
+    db.session.commit()
+    
+    assert cache.get(ANALYTICS_VERSION_KEY) > version
+
+
+def test_notification_counter_bump(app):
+    """Contador em cache é ajustado; contador ausente não é criado só com o delta"""
+    from app.models import bump_notification_counter
+    
+    cache.set('notif:unread:1', 5)
+    bump_notification_counter('notif:unread:1', 2)
+    bump_notification_counter('notif:unread:1', -1)
+    assert cache.get('notif:unread:1') == 6
+    
+    bump_notification_counter('notif:unread:2', 1)
+    assert cache.get('notif:unread:2') is None